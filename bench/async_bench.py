@@ -0,0 +1,206 @@
+"""
+Compare checkout throughput of the sync (WSGI) and async (ASGI) serving
+modes while Stripe is slow.
+
+A local mock of the Stripe API answers every request after a fixed delay.
+The sync mode runs the Flask app on a WSGI server with a fixed pool of
+worker threads, like a threaded gunicorn worker; the async mode runs
+asgi:create_application on uvicorn. Both are driven with the same number of
+concurrent clients posting to /create_checkout_session. The mock, the
+server under test and the load generator each get their own process so
+they do not compete for the GIL.
+
+    python bench/async_bench.py --latency 0.2 --concurrency 200 --threads 8
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import stripe
+import uvicorn
+from werkzeug.serving import BaseWSGIServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), "src"))
+os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_bench")
+
+
+def mock_stripe(latency):
+    """
+    Minimal ASGI stand-in for the Stripe checkout sessions endpoint.
+    """
+    counter = iter(range(10 ** 9))
+
+    async def application(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        await asyncio.sleep(latency)
+        session_id = f"cs_test_{next(counter)}"
+        body = json.dumps({
+            "id": session_id,
+            "object": "checkout.session",
+            "status": "open",
+            "url": f"https://checkout.stripe.com/c/pay/{session_id}",
+        }).encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+    return application
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server handling requests on a fixed number of threads.
+    """
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app)
+        self.pool = ThreadPoolExecutor(threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def run_mock(port, latency):
+    uvicorn.run(mock_stripe(latency), host="127.0.0.1", port=port,
+                log_level="warning")
+
+
+def run_sync(port, threads, database_uri, stripe_port):
+    from app import create_app
+    from model import ensure_schema
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": database_uri})
+    with app.app_context():
+        ensure_schema()
+    stripe.api_base = f"http://127.0.0.1:{stripe_port}"
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    PooledWSGIServer("127.0.0.1", port, app, threads).serve_forever()
+
+
+def run_async(port, database_uri, stripe_port):
+    from asgi import create_application
+
+    application = create_application(
+        {"SQLALCHEMY_DATABASE_URI": database_uri})
+    stripe.api_base = f"http://127.0.0.1:{stripe_port}"
+    uvicorn.run(application, host="127.0.0.1", port=port,
+                log_level="warning", lifespan="on")
+
+
+def start_process(target, *args):
+    port = free_port()
+    process = multiprocessing.Process(target=target, args=(port, *args),
+                                      daemon=True)
+    process.start()
+    wait_for_port(port)
+    return process, port
+
+
+async def drive(base_url, requests, concurrency):
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits,
+                                 timeout=120) as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.post("/create_checkout_session")
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 303:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Seconds the mock Stripe API takes to answer.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8,
+                        help="Worker threads of the sync server.")
+    parser.add_argument("--output", help="Save results as JSON.")
+    args = parser.parse_args()
+
+    database_uri = \
+        "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    mock, stripe_port = start_process(run_mock, args.latency)
+
+    results = {}
+    servers = {
+        "sync": (run_sync, args.threads, database_uri, stripe_port),
+        "async": (run_async, database_uri, stripe_port),
+    }
+    for mode, (target, *target_args) in servers.items():
+        server, port = start_process(target, *target_args)
+        results[mode] = asyncio.run(drive(f"http://127.0.0.1:{port}",
+                                          args.requests, args.concurrency))
+        server.terminate()
+        server.join()
+    mock.terminate()
+
+    for mode, stats in results.items():
+        print(f"{mode:<6} {stats['throughput_rps']:>8} req/s  "
+              f"p50 {stats['p50_ms']:>8}ms  p99 {stats['p99_ms']:>8}ms  "
+              f"{stats['errors']} errors")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Show how admission control keeps /login responsive under overload.
+
+The app runs on a WSGI server with a fixed pool of worker threads and is
+sent more concurrent logins than the CPU can hash passwords for, once with
+the concurrency limit on /login and once without. Without it every request
+is admitted and all of them slow down together; with it the excess is
+answered with an immediate 503 and admitted logins keep their latency.
+
+    python bench/overload_bench.py --concurrency 32 --login-slots 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), "src"))
+
+from async_bench import PooledWSGIServer, start_process  # noqa: E402
+
+EMAIL = "user1@example.com"
+PASSWORD = "password123"
+
+
+def run_server(port, threads, database_uri, login_slots):
+    import logging
+
+    from app import create_app
+
+    # Only the concurrency cap, every request comes from the same address
+    # so per client buckets would reject most of them
+    rules = {"main.login": {"methods": ["POST"], "concurrency": login_slots}}
+    app = create_app({"SQLALCHEMY_DATABASE_URI": database_uri,
+                      "RATELIMIT_ENABLED": bool(login_slots),
+                      "RATELIMIT_RULES": rules})
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    PooledWSGIServer("127.0.0.1", port, app, threads).serve_forever()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1,
+                            int(p / 100 * len(values)))] * 1000, 1)
+
+
+async def drive(base_url, seconds, concurrency):
+    admitted, rejected, errors = [], [], 0
+    deadline = time.monotonic() + seconds
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/login", data={"email": EMAIL, "password": PASSWORD})
+                elapsed = time.perf_counter() - start
+                if response.status_code == 302:
+                    admitted.append(elapsed)
+                elif response.status_code == 503:
+                    rejected.append(elapsed)
+                    await asyncio.sleep(
+                        float(response.headers["Retry-After"]))
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "logins_per_second": round(len(admitted) / elapsed, 1),
+        "admitted": len(admitted),
+        "admitted_p50_ms": percentile(admitted, 50),
+        "admitted_p99_ms": percentile(admitted, 99),
+        "rejected": len(rejected),
+        "rejected_p99_ms": percentile(rejected, 99),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=16,
+                        help="Worker threads of the server.")
+    parser.add_argument("--login-slots", type=int, default=2,
+                        help="Concurrent logins admitted when limiting.")
+    parser.add_argument("--output", help="Save results as JSON.")
+    args = parser.parse_args()
+
+    from app import create_app
+    from model import ensure_schema
+    from seed import seed_database
+
+    database_uri = \
+        "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": database_uri})
+    with app.app_context():
+        ensure_schema()
+        seed_database(1, 0, 0, password=PASSWORD)
+
+    results = {}
+    for mode, slots in (("unlimited", 0), ("limited", args.login_slots)):
+        server, port = start_process(run_server, args.threads, database_uri,
+                                     slots)
+        results[mode] = asyncio.run(drive(f"http://127.0.0.1:{port}",
+                                          args.seconds, args.concurrency))
+        server.terminate()
+        server.join()
+
+    for mode, stats in results.items():
+        print(f"{mode:<10} {stats['logins_per_second']:>6} logins/s  "
+              f"p50 {stats['admitted_p50_ms']:>8}ms  "
+              f"p99 {stats['admitted_p99_ms']:>8}ms  "
+              f"{stats['rejected']} rejected "
+              f"(p99 {stats['rejected_p99_ms']}ms)  {stats['errors']} errors")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Load test for the main routes of the app.
+
+Seeds a throwaway SQLite database, then drives each route with concurrent
+workers, either through the Flask test client or over HTTP against a real
+threaded WSGI server. Reports throughput, latency percentiles, SQL queries
+per request and the peak RSS during every route and saves them as JSON so
+runs can be compared across commits.
+
+    python bench/routes_bench.py --users 1000 --listings 20000 --images 2000 \\
+        --mode both --output bench_results.json
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from urllib.parse import urlencode
+
+import requests
+from werkzeug.serving import make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from app import create_app  # noqa: E402
+from instrumentation import count_queries  # noqa: E402
+from model import ensure_schema  # noqa: E402
+from seed import SCHOOLS, seed_database  # noqa: E402
+
+PASSWORD = "password123"
+
+
+class TestClientSession:
+    def __init__(self, app, base_url=None):
+        self.client = app.test_client()
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data=data).status_code
+
+
+class HTTPSession:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def get(self, path):
+        return self.session.get(self.base_url + path,
+                                allow_redirects=False).status_code
+
+    def post(self, path, data):
+        # The test client takes (file, name) tuples, requests (name, file)
+        files = {k: v[::-1] for k, v in data.items() if isinstance(v, tuple)}
+        form = {k: v for k, v in data.items() if not isinstance(v, tuple)}
+        return self.session.post(self.base_url + path, data=form,
+                                 files=files or None,
+                                 allow_redirects=False).status_code
+
+
+def listing_form(rng):
+    return {
+        "name": f"Benchmark item {rng.randrange(10 ** 6)}",
+        "description": "Posted by the load test",
+        "price": str(round(rng.uniform(1, 500), 2)),
+        "listingType": "selling",
+        "images": (io.BytesIO(rng.randbytes(4096)), "bench.jpg"),
+    }
+
+
+def scenarios(users, listings):
+    """
+    Route name -> (needs login, request function taking (session, rng)).
+    """
+    def email(rng):
+        return f"user{rng.randrange(users) + 1}@example.com"
+
+    return {
+        "/": (False, lambda s, rng: s.get("/")),
+        "/?search=": (False, lambda s, rng: s.get("/?search=Desk")),
+        "/?school=": (False, lambda s, rng: s.get(
+            "/?" + urlencode({"school": rng.choice(SCHOOLS[:-1])}))),
+        "/listing-detail": (False, lambda s, rng: s.get(
+            f"/listing-detail?id={rng.randrange(listings) + 1}")),
+        "/api/listings": (False, lambda s, rng: s.get(
+            "/api/listings?limit=100")),
+        "/login": (False, lambda s, rng: s.post(
+            "/login", {"email": email(rng), "password": PASSWORD})),
+        "/create-listing": (True, lambda s, rng: s.post(
+            "/create-listing", listing_form(rng))),
+    }
+
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def rss_bytes():
+    # Linux only, None elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+class RSSSampler:
+    """
+    Peak resident memory while one route runs, sampled in a thread. The
+    process's own high-water mark would carry over from earlier routes.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.baseline = self.peak = rss_bytes()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        if self.baseline is not None:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.baseline is not None:
+            self.stop_event.set()
+            self.thread.join()
+
+    def result(self) -> dict:
+        if self.baseline is None:
+            return {"peak_rss_mb": None, "rss_growth_mb": None}
+        return {"peak_rss_mb": round(self.peak / 2 ** 20, 1),
+                "rss_growth_mb": round((self.peak - self.baseline) / 2 ** 20,
+                                       1)}
+
+
+def run_route(session_class, base_url, func, needs_login, n, workers,
+              users, seed):
+    def connect(index):
+        session = session_class(base_url)
+        if needs_login:
+            session.post("/login", {"email": f"user{index % users + 1}@example.com",
+                                    "password": PASSWORD})
+        return session
+
+    def worker(index, session):
+        rng = random.Random(seed * 1000 + index)
+        latencies, errors = [], 0
+        for _ in range(n // workers + (index < n % workers)):
+            start = time.perf_counter()
+            status = func(session, rng)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors += 1
+        return latencies, errors
+
+    with ThreadPoolExecutor(workers) as pool:
+        # Logins happen before measuring so they are not counted
+        sessions = list(pool.map(connect, range(workers)))
+        start = time.perf_counter()
+        with count_queries() as statements, RSSSampler() as rss:
+            results = list(pool.map(worker, range(workers), sessions))
+        elapsed = time.perf_counter() - start
+
+    latencies = [l for result in results for l in result[0]]
+    return {
+        "requests": len(latencies),
+        "errors": sum(result[1] for result in results),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "queries_per_request": round(
+            len(statements) / len(latencies), 2),
+        **rss.result(),
+    }
+
+
+def git_commit():
+    try:
+        # The commit of this checkout, wherever the script is run from
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--images", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=200,
+                        help="Requests per route.")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--mode", choices=["testclient", "wsgi", "both"],
+                        default="testclient")
+    parser.add_argument("--routes", nargs="*",
+                        help="Only run these routes (default: all).")
+    parser.add_argument("--feed-cache-seconds", type=float, default=30,
+                        help="0 to measure uncached feed queries.")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="Keep the rate limiter on. Every worker comes "
+                             "from 127.0.0.1, so most requests to the "
+                             "limited routes are then rejected.")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    app = create_app({"SQLALCHEMY_DATABASE_URI":
+                      "sqlite:///" + os.path.join(tmpdir, "bench.db"),
+                      "FEED_CACHE_SECONDS": args.feed_cache_seconds,
+                      "RATELIMIT_ENABLED": args.rate_limit})
+
+    with app.app_context():
+        ensure_schema()
+        start = time.perf_counter()
+        seed_database(args.users, args.listings, args.images, args.seed,
+                      PASSWORD)
+        seed_time = time.perf_counter() - start
+    print(f"Seeded {args.users} users, {args.listings} listings, "
+          f"{args.images} images in {seed_time:.2f}s")
+
+    modes = ["testclient", "wsgi"] if args.mode == "both" else [args.mode]
+    routes = scenarios(args.users, args.listings)
+    results = {}
+    for mode in modes:
+        server = None
+        base_url = None
+        session_class = partial(TestClientSession, app)
+        if mode == "wsgi":
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)
+            server = make_server("127.0.0.1", 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+            session_class = HTTPSession
+
+        results[mode] = {}
+        for name, (needs_login, func) in routes.items():
+            if args.routes and name not in args.routes:
+                continue
+            stats = run_route(session_class, base_url, func, needs_login,
+                              args.requests, args.workers,
+                              args.users, args.seed)
+            results[mode][name] = stats
+            print(f"{mode:<10} {name:<16} {stats['throughput_rps']:>8} req/s  "
+                  f"p50 {stats['p50_ms']:>8}ms  p95 {stats['p95_ms']:>8}ms  "
+                  f"p99 {stats['p99_ms']:>8}ms  "
+                  f"{stats['queries_per_request']:>6} queries  "
+                  f"{stats['errors']} errors  {stats['peak_rss_mb']}MB "
+                  f"(+{stats['rss_growth_mb']}MB)")
+
+        if server:
+            server.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "seed_seconds": round(seed_time, 2),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measure how long a worker takes to import the app and build it with
+create_app, and fail if it gets slower than a budget or starts importing
+modules that should stay lazy.
+
+Each run is a fresh interpreter started with ``python -X importtime`` so
+the numbers match a cold worker boot. The import breakdown of the median
+run shows where the time goes.
+
+    python bench/startup_bench.py --runs 5
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), "src")
+
+# What a worker does on boot, see wsgi.py. The schema check is left out, it
+# runs once before forking and would touch the real database.
+BOOT = "from app import create_app; create_app()"
+# Modules only needed by routes that load them on first use
+LAZY_MODULES = ["stripe", "smtplib"]
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def boot_once(python: str) -> dict:
+    """
+    Boot the app in a new interpreter, returning the wall time and the
+    import times reported by -X importtime, in microseconds.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([python, "-X", "importtime", "-c", BOOT],
+                            cwd=SRC, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"App failed to boot:\n{result.stderr}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            imports.append({"module": name, "self_us": int(own),
+                            "cumulative_us": int(cumulative),
+                            "depth": (len(indent) - 1) // 2})
+    return {"wall_ms": wall * 1000, "imports": imports}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500,
+                        help="Fail if the median boot is slower than this, "
+                             "0 disables.")
+    parser.add_argument("--top", type=int, default=15,
+                        help="Slowest direct imports to list.")
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--output", help="Save results as JSON.")
+    args = parser.parse_args()
+
+    runs = [boot_once(args.python) for _ in range(args.runs)]
+    runs.sort(key=lambda run: run["wall_ms"])
+    median = runs[len(runs) // 2]
+    wall_ms = statistics.median(run["wall_ms"] for run in runs)
+    import_ms = sum(i["self_us"] for i in median["imports"]) / 1000
+
+    print(f"Boot: median {wall_ms:.1f}ms, min {runs[0]['wall_ms']:.1f}ms, "
+          f"max {runs[-1]['wall_ms']:.1f}ms over {args.runs} runs")
+    print(f"Imports: {len(median['imports'])} modules in {import_ms:.1f}ms\n")
+    # Direct imports of the boot code and of its modules, nested imports
+    # are counted in their parent's cumulative time
+    direct = sorted((i for i in median["imports"] if i["depth"] <= 1),
+                    key=lambda i: i["cumulative_us"], reverse=True)
+    for i in direct[:args.top]:
+        print(f"{i['cumulative_us'] / 1000:>9.1f}ms  {i['module']}")
+
+    failures = []
+    loaded = {i["module"] for i in median["imports"]}
+    for module in LAZY_MODULES:
+        if module in loaded:
+            failures.append(f"{module} is imported at startup")
+    if args.budget_ms and wall_ms > args.budget_ms:
+        failures.append(f"median boot {wall_ms:.1f}ms is over the "
+                        f"{args.budget_ms:.0f}ms budget")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "wall_ms": wall_ms,
+                       "import_ms": import_ms, "imports": median["imports"],
+                       "failures": failures}, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
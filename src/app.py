@@ -1,29 +1,84 @@
 import base64
+import json
 import os
+import sqlite3
+import time
 from datetime import date, datetime, timedelta
 
+import click
 import sqlalchemy as sq
-import stripe
-from flask import Flask, jsonify, redirect, render_template, request, session
+from dotenv import load_dotenv
+from flask import (Blueprint, Flask, Response, current_app, jsonify,
+                   redirect, render_template, request, session,
+                   stream_with_context)
 from flask_login import (LoginManager, current_user, login_required,
                          login_user, logout_user)
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Integer, String
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-
-from model import DB_PATH, Image, Listing, User, init_db, insert_test_data
-from stripe_handler import StripeHandler
-
-app = Flask(__name__)
-app.config["SECRET_KEY"] = "bashproshop"
-app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)
-app.config["REMEMBER_COOKIE_DURATION"] = timedelta(days=7)
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import dbops
+from feed import ALL_CAMPUSES, SchoolFeed, feed_page
+from instrumentation import Instrumentation
+from listing_import import ListingImporter, detect_format
+from model import (DB_PATH, DEFAULT_LISTING_FIELDS, LISTING_FIELDS, Image,
+                   Listing, User, db, ensure_schema, init_db, insert_test_data)
+from profiler import SamplingProfiler
+from ratelimit import RateLimiter
+from seed import seed_database
+from stats import rebuild_stats, record_order, record_view, seller_dashboard
+
+# Routes and CLI commands, registered on the app by create_app. CLI commands
+# are top level (flask seed, not flask main seed).
+bp = Blueprint("main", __name__, cli_group=None)
 
 login_manager = LoginManager()
-login_manager.init_app(app)
 
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+EXPORT_BATCH_SIZE = 500
+
+
+def create_app(config: dict = None) -> Flask:
+    """
+    Build and configure the Flask app. Nothing here touches the database or
+    imports the Stripe SDK, so it is cheap to call in every worker and safe
+    to call before forking (gunicorn --preload). The schema is checked
+    separately by ensure_schema, see wsgi.py and the init-db command.
+    """
+    load_dotenv()
+
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "bashproshop"
+    app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)
+    app.config["REMEMBER_COOKIE_DURATION"] = timedelta(days=7)
+    app.config["ADMIN_EMAILS"] = [email for email in os.getenv(
+        "ADMIN_EMAILS", "").split(",") if email]
+    app.config["STRIPE_WEBHOOK_SECRET"] = os.getenv("STRIPE_WEBHOOK_SECRET")
+    app.config["SCHOOL_SHARDS"] = os.getenv("SCHOOL_SHARDS")
+    app.config["RATELIMIT_STORAGE"] = os.getenv("RATELIMIT_STORAGE")
+    # Reverse proxies in front of the app, such as nginx, whose
+    # X-Forwarded-For and X-Forwarded-Proto headers are trusted
+    app.config["TRUSTED_PROXIES"] = int(os.getenv("TRUSTED_PROXIES", 0))
+    if config:
+        app.config.update(config)
+
+    proxies = app.config["TRUSTED_PROXIES"]
+    if proxies:
+        # Otherwise every client has the proxy's address and the per IP
+        # rate limits apply to the whole site
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
+    login_manager.init_app(app)
+    init_db(app)
+    Instrumentation(app)
+    # After instrumentation so rejections are exported on /metrics
+    RateLimiter(app)
+    SamplingProfiler(app)
+    SchoolFeed(app)
+    app.register_blueprint(bp)
+    return app
 
 
 @login_manager.user_loader
@@ -31,7 +86,7 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
-@app.route("/login", methods=["POST", "GET"])
+@bp.route("/login", methods=["POST", "GET"])
 def login():
     if request.method == "POST":
         email = request.form.get("email")
@@ -49,14 +104,14 @@ def login():
     return render_template("login.html")
 
 
-@app.route("/logout")
+@bp.route("/logout")
 @login_required
 def logout():
     logout_user()
     return jsonify({"message": "Logged out successfully"})
 
 
-@app.route("/signup", methods=["GET", "POST"])
+@bp.route("/signup", methods=["GET", "POST"])
 def signup():
     if request.method == "POST":
         first_name = request.form.get("firstName")
@@ -87,25 +142,30 @@ def signup():
         return render_template("signup.html")
 
 
-@app.route("/my-listings", methods=["GET"])
+@bp.route("/my-listings", methods=["GET"])
 @login_required
 def my_listings():
-    listings = Listing.get_next(0, 100, [], [Listing.post_date])
-    listings = Listing.get_next(0, 100, [], [Listing.post_date])
-    for listing in listings:
-        images = Image.get_for(listing)
-        if images:
-            listing.imgsrc = f"data:image/;base64,{
-                images[0].encoded.decode('utf-8')}"
-    return render_template("my_listings.html", listings=current_user.get_listings())
+    # Every listing of the user with its first image, in two queries
+    listings = feed_page(db.session, ALL_CAMPUSES,
+                         [Listing.seller_id == current_user.id], None)
+    return render_template("my_listings.html", listings=listings)
 
 
-@app.route("/")
-def listings():
-    search = request.args.get("search")
-    free = request.args.get("free", "off")
-    min_price = request.args.get("min-price")
-    max_price = request.args.get("max-price")
+@bp.route("/dashboard", methods=["GET"])
+@login_required
+def dashboard():
+    return render_template("dashboard.html",
+                           **seller_dashboard(current_user.id))
+
+
+def listing_filters(args):
+    """
+    Build the search and price filters shared by the feed and the API.
+    """
+    search = args.get("search")
+    free = args.get("free", "off")
+    min_price = args.get("min-price")
+    max_price = args.get("max-price")
 
     if not min_price:
         min_price = 0
@@ -113,10 +173,7 @@ def listings():
     if not max_price:
         max_price = float("inf")
 
-    filters = [
-        Listing.seller_id != current_user.get_id(),
-        Listing.price.between(min_price, max_price),
-    ]
+    filters = [Listing.price.between(min_price, max_price)]
 
     if free == "off":
         filters.append(Listing.price != 0)
@@ -124,38 +181,209 @@ def listings():
     if search:
         filters.append(Listing.name.contains(search))
 
-    listings = Listing.get_next(0,
-                                100,
-                                filters,
-                                [Listing.post_date],
-                                )
+    return filters
+
 
-    for listing in listings:
-        images = Image.get_for(listing)
-        if images:
-            listing.imgsrc = f"data:image/;base64,{
-                images[0].encoded.decode('utf-8')}"
+def feed_school(args):
+    """
+    The campus whose feed to show: the ``school`` argument, else the
+    user's own school, else every campus.
+    """
+    school = args.get("school")
+    if school:
+        return school
+    if current_user.is_authenticated and current_user.school:
+        return current_user.school
+    return ALL_CAMPUSES
+
+
+@bp.route("/")
+def listings():
+    feed = current_app.extensions["feed"]
+    school = feed_school(request.args)
+    filters = listing_filters(request.args)
+    # Cached pages are shared between users. Only a seller whose own
+    # listings are on the shared page gets a page of their own, queried
+    # without them so they cannot crowd out everyone else's.
+    listings = feed.listings(school, filters, request.query_string)
+    if current_user.is_authenticated and any(
+            listing["seller_id"] == current_user.id for listing in listings):
+        listings = feed.listings(
+            school, filters + [Listing.seller_id != current_user.id],
+            (current_user.id, request.query_string))
 
     return render_template("listings.html", listings=listings)
 
 
-@app.route("/create_checkout_session", methods=["POST"])
+def api_listing_query(args):
+    """
+    Parse the /api/listings query string into the fields to return and the
+    arguments for Listing.get_next. Raises ValueError for invalid input.
+    """
+    fields = args.get("fields")
+    if fields:
+        fields = fields.split(",")
+        unknown = [f for f in fields if f not in LISTING_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        fields = DEFAULT_LISTING_FIELDS
+
+    try:
+        cursor = args.get("cursor")
+        cursor = int(cursor) if cursor is not None else None
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    try:
+        limit = int(args.get("limit", API_PAGE_SIZE))
+        if limit <= 0:
+            raise ValueError
+    except ValueError:
+        raise ValueError("Invalid limit")
+    limit = min(limit, API_MAX_PAGE_SIZE)
+
+    filters = listing_filters(args)
+    if args.get("school"):
+        filters.append(Listing.school == args.get("school"))
+    return fields, filters, cursor, limit
+
+
+def api_listing_page(listings, fields, limit) -> dict:
+    next_cursor = listings[-1].id if len(listings) == limit else None
+    return {
+        "listings": [listing.to_dict(fields) for listing in listings],
+        "next_cursor": next_cursor,
+    }
+
+
+@bp.route("/api/listings", methods=["GET"])
+def api_listings():
+    try:
+        fields, filters, cursor, limit = api_listing_query(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    if request.args.get("format") == "ndjson":
+        return export_listings(filters, fields)
+
+    listings = Listing.get_next(0,
+                                limit,
+                                filters,
+                                [Listing.id],
+                                fields=fields,
+                                after=cursor,
+                                )
+    return jsonify(api_listing_page(listings, fields, limit))
+
+
+def export_listings(filters, fields):
+    """
+    Stream every matching listing as newline-delimited JSON. Rows are
+    fetched in id ordered batches, each a new short query, so memory stays
+    constant no matter how large the catalogue is and no read lock is held
+    while a slow client downloads.
+    """
+    statement = Listing.select_fields(fields) \
+        .filter(*filters) \
+        .order_by(Listing.id) \
+        .limit(EXPORT_BATCH_SIZE)
+
+    def generate():
+        last_id = 0
+        while True:
+            listings = db.session.scalars(
+                statement.filter(Listing.id > last_id)).all()
+            lines = [json.dumps(listing.to_dict(fields)) + "\n"
+                     for listing in listings]
+            # Give the connection back between batches
+            db.session.rollback()
+            yield "".join(lines)
+            if len(listings) < EXPORT_BATCH_SIZE:
+                return
+            last_id = listings[-1].id
+
+    return Response(stream_with_context(generate()),
+                    mimetype="application/x-ndjson")
+
+
+@bp.route("/create_checkout_session", methods=["POST"])
 def checkout_session():
+    # Imported here so workers only load the Stripe SDK when it is used
+    from stripe_handler import StripeHandler
+
+    listing = None
+    listing_id = request.form.get("listing_id", type=int)
+    if listing_id is not None:
+        listing = db.get_or_404(Listing, listing_id)
+    buyer_id = current_user.get_id() if current_user.is_authenticated \
+        else None
     handler = StripeHandler()
-    return handler.create_checkout_session()
-
-
-@app.route("/payment_success", methods=["GET"])
+    return handler.create_checkout_session(listing, buyer_id)
+
+
+def record_checkout(checkout):
+    """
+    Record the order of a completed checkout session for the buyer and
+    listing it was created for. Returns None if there is nothing to record
+    or it was recorded before.
+    """
+    listing_id = (checkout.metadata or {}).get("listing_id")
+    buyer_id = checkout.client_reference_id
+    if not listing_id or not buyer_id:
+        return None
+    listing = db.session.get(Listing, int(listing_id))
+    if listing is None:
+        return None
+    amount = checkout.amount_total / 100 \
+        if checkout.amount_total is not None else None
+    return record_order(listing, int(buyer_id), amount, checkout.id)
+
+
+@bp.route("/payment_success", methods=["GET"])
 def payment_success():
+    session_id = request.args.get("session_id")
+    if session_id and current_user.is_authenticated:
+        from stripe_handler import StripeHandler
+
+        # Stripe redirects here with the session id, record the order once
+        # the payment went through. Only the buyer the session was created
+        # for can record it, anyone can paste a session id.
+        result = StripeHandler().check_checkout_session(session_id)
+        if result is not None and result[1] == "complete" \
+                and result[0].client_reference_id == current_user.get_id():
+            record_checkout(result[0])
     return render_template("payment_success.html")
 
 
-@app.route("/payment_cancel", methods=["GET"])
+@bp.route("/stripe/webhook", methods=["POST"])
+def stripe_webhook():
+    """
+    Stripe's checkout.session.completed event, so an order is recorded even
+    if the buyer's browser never follows the redirect to /payment_success.
+    Orders are recorded once per session whichever arrives first.
+    """
+    secret = current_app.config["STRIPE_WEBHOOK_SECRET"]
+    if not secret:
+        return jsonify({"message": "Webhooks are not configured"}), 404
+    from stripe_handler import StripeHandler
+
+    event = StripeHandler.webhook_event(
+        request.get_data(), request.headers.get("Stripe-Signature"), secret)
+    if event is None:
+        return jsonify({"message": "Invalid signature"}), 400
+    if event["type"] == "checkout.session.completed":
+        checkout = event["data"]["object"]
+        if checkout.payment_status == "paid":
+            record_checkout(checkout)
+    return jsonify({"received": True})
+
+
+@bp.route("/payment_cancel", methods=["GET"])
 def payment_cancel():
     return render_template("payment_cancel.html")
 
 
-@app.route("/create-listing", methods=['GET', 'POST'])
+@bp.route("/create-listing", methods=['GET', 'POST'])
 @login_required
 def createlisting():
     if request.method == "POST":
@@ -177,76 +405,256 @@ def createlisting():
         if not name or not description or not price or not images:
             return jsonify({"message": "All fields are required"}), 400
 
-        # validate price
+        # validate price and renting information
         try:
-            price = float(price)
-            if price < 0:
-                return jsonify({"message": "Price cannot be less than 0"}), 400
-        except ValueError:
-            return jsonify({"message": "Invalid price"}), 400
-
-        # validate renting information
-        if listing_type == "renting":
-            if not start_date or not duration:
-                return (
-                    jsonify(
-                        {"message": "Start date and duration are required for rentals"}
-                    ),
-                    400,
+            values = Listing.validate(name, description, price,
+                                      listing_type, start_date, duration)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        new_listing = Listing(
+            seller_id=current_user.id,
+            post_date=date.today(),
+            school=current_user.school,
+            **values
+        )
+
+        db.session.add(new_listing)
+        db.session.commit()
+
+        listing_id = new_listing.id
+        for image in images:
+            if image:
+                image_string = base64.b64encode(image.read())
+                new_image = Image(
+                    listing_id=listing_id,
+                    name=image.filename,
+                    encoded=image_string
                 )
-            try:
-                duration = int(duration)
-                if duration <= 0:
-                    return (
-                        jsonify(
-                            {"message": "Duration must be a positive integer"}),
-                        400,
-                    )
-            except ValueError:
-                return jsonify({'message': 'Invalid duration'}), 400
-
-        with app.app_context():
-            new_listing = Listing(
-                seller_id=current_user.id,
-                name=name,
-                description=description,
-                price=price,
-                post_date=date.today(),
-                duration=duration if duration else None,
-                start_date=datetime.strptime(
-                    start_date, '%Y-%m-%d') if start_date else None
-            )
-
-            db.session.add(new_listing)
-            db.session.commit()
-
-            listing_id = new_listing.id
-            for image in images:
-                if image:
-                    image_string = base64.b64encode(image.read())
-                    new_image = Image(
-                        listing_id=listing_id,
-                        name=image.filename,
-                        encoded=image_string
-                    )
-                    db.session.add(new_image)
-            db.session.commit()
-            return redirect('/my-listings')
+                db.session.add(new_image)
+        db.session.commit()
+        current_app.extensions["feed"].sync([listing_id])
+        return redirect('/my-listings')
 
     if request.method == "GET":
         return render_template("create_listing.html")
 
 
-@app.route("/listing-detail")
+@bp.route("/import-listings", methods=["GET", "POST"])
+@login_required
+def import_listings():
+    if request.method == "POST":
+        listings_file = request.files.get("listings")
+        images = request.files.get("images")
+        if not listings_file:
+            return jsonify({"message": "A CSV or NDJSON file is required"}), 400
+
+        try:
+            importer = ListingImporter(
+                current_user.id, images=images.stream if images else None)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        summary = importer.run(listings_file.stream,
+                               detect_format(listings_file.filename or ""))
+        current_app.extensions["feed"].sync(importer.listing_ids)
+        return jsonify(summary)
+
+    return render_template("import_listings.html")
+
+
+@bp.cli.command("import-listings")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--seller", "seller_email", required=True,
+              help="Email of the user the listings are posted by.")
+@click.option("--images", type=click.Path(exists=True, dir_okay=False),
+              help="Zip archive with the images referenced by the file.")
+def import_listings_command(path, seller_email, images):
+    """Bulk import listings from a CSV or NDJSON file."""
+    ensure_schema()
+    seller = User.query.filter_by(email=seller_email).first()
+    if seller is None:
+        raise click.ClickException(f"No user with email {seller_email}")
+
+    try:
+        importer = ListingImporter(seller.id, images=images)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    with open(path, "rb") as f:
+        summary = importer.run(f, detect_format(path))
+    current_app.extensions["feed"].sync(importer.listing_ids)
+    for error in summary["errors"]:
+        click.echo(f"line {error['line']}: {error['message']}", err=True)
+    click.echo(f"Imported {summary['inserted']} listings, "
+               f"{len(summary['errors'])} rejected")
+
+
+@bp.cli.command("seed")
+@click.option("--users", default=100, help="Number of users to create.")
+@click.option("--listings", default=1000, help="Number of listings to create.")
+@click.option("--images", default=500, help="Number of images to create.")
+@click.option("--seed", default=0, help="Random seed, same seed same data.")
+def seed_command(users, listings, images, seed):
+    """Fill the database with a synthetic dataset."""
+    ensure_schema()
+    counts = seed_database(users, listings, images, seed)
+    click.echo(f"Inserted {counts['users']} users, {counts['listings']} "
+               f"listings and {counts['images']} images")
+    feed = current_app.extensions["feed"]
+    if feed.sharded:
+        click.echo(f"Copied {feed.rebuild()} listings to the school shards")
+
+
+@bp.cli.command("init-db")
+def init_db_command():
+    """Create missing tables and columns."""
+    ensure_schema()
+    Listing.backfill_schools()
+    click.echo("Database schema is up to date")
+
+
+@bp.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    """Recompute the seller dashboard totals from orders and views."""
+    counts = rebuild_stats()
+    click.echo(f"Rebuilt totals for {counts['listings']} listings and "
+               f"{counts['days']} seller days")
+
+
+@bp.cli.command("build-shards")
+def build_shards_command():
+    """Recreate the per-school shard files from the main database."""
+    feed = current_app.extensions["feed"]
+    if not feed.sharded:
+        raise click.ClickException("SCHOOL_SHARDS is not set")
+    click.echo(f"Copied {feed.rebuild()} listings to "
+               f"{len(feed.shard_names())} shards")
+
+
+@bp.cli.group("db")
+def db_cli():
+    """Backups and maintenance of the SQLite database."""
+
+
+def database_path() -> str:
+    path = db.engine.url.database
+    if db.engine.url.get_backend_name() != "sqlite" or not path \
+            or path == ":memory:":
+        raise click.ClickException("Only SQLite database files are supported")
+    return path
+
+
+@db_cli.command("backup")
+@click.argument("directory", type=click.Path(file_okay=False))
+@click.option("--keep", default=7, help="Backups to keep, 0 keeps all.")
+@click.option("--pages", default=dbops.BACKUP_PAGES,
+              help="Pages copied per step.")
+@click.option("--pause", default=dbops.BACKUP_PAUSE,
+              help="Seconds between steps.")
+def backup_command(directory, keep, pages, pause):
+    """Back up the live database into DIRECTORY."""
+    result = dbops.rotate_backups(database_path(), directory, keep,
+                                  pages=pages, pause=pause)
+    click.echo(f"Wrote {result['path']} ({dbops.format_size(result['bytes'])}"
+               f") in {result['steps']} steps, {result['seconds']:.1f}s")
+
+
+@db_cli.command("vacuum")
+@click.option("--enable", is_flag=True,
+              help="Switch to incremental auto vacuum first. Rewrites the "
+                   "whole file under an exclusive lock.")
+def vacuum_command(enable):
+    """Return free pages to the file system and run PRAGMA optimize."""
+    path = database_path()
+    if enable and dbops.enable_incremental_vacuum(path):
+        click.echo("Enabled incremental auto vacuum")
+    result = dbops.incremental_vacuum(path)
+    if not result["incremental"]:
+        click.echo("Incremental auto vacuum is off, run with --enable once "
+                   "to reclaim free pages", err=True)
+    freed = result["freed_pages"] * result["page_size"]
+    click.echo(f"Freed {dbops.format_size(freed)}, statistics optimized")
+
+
+@db_cli.command("report")
+def report_command():
+    """Show file size, free pages and the size of each table and index."""
+    report = dbops.space_report(database_path())
+    free = report["free_pages"] * report["page_size"]
+    click.echo(f"File {dbops.format_size(report['bytes'])}, "
+               f"{report['pages']} pages of {report['page_size']}B, "
+               f"{report['free_pages']} free ({dbops.format_size(free)}), "
+               f"auto vacuum {report['auto_vacuum']}")
+    if report["estimated"]:
+        click.echo("dbstat is not available, table sizes are estimates")
+    for item in report["objects"]:
+        share = item["bytes"] / report["bytes"] * 100 if report["bytes"] else 0
+        click.echo(f"{dbops.format_size(item['bytes']):>10} {share:5.1f}%  "
+                   f"{item['name']}"
+                   + (f" (on {item['table']})"
+                      if item["table"] != item["name"] else ""))
+
+
+@db_cli.command("check")
+@click.option("--full", is_flag=True,
+              help="Full integrity check, also verifies indexes. Slower.")
+def check_command(full):
+    """Check the database for corruption."""
+    problems = dbops.integrity_check(database_path(), full)
+    for problem in problems:
+        click.echo(problem, err=True)
+    if problems:
+        raise click.ClickException(f"{len(problems)} problems found")
+    click.echo("ok")
+
+
+@db_cli.command("maintain")
+@click.option("--backup-dir", type=click.Path(file_okay=False),
+              help="Also back up into this directory.")
+@click.option("--keep", default=7, help="Backups to keep, 0 keeps all.")
+@click.option("--interval", default=3600, help="Seconds between runs.")
+@click.option("--once", is_flag=True, help="Run once and exit.")
+def maintain_command(backup_dir, keep, interval, once):
+    """
+    Back up and vacuum the database every INTERVAL seconds, for running
+    as a background job next to the web workers. Each backup is checked
+    before it replaces an older one, the live database is only checked by
+    ``db check``.
+    """
+    path = database_path()
+    while True:
+        start = f"{datetime.now():%Y-%m-%d %H:%M:%S}"
+        try:
+            if backup_dir:
+                # Raises before rotating if the copy fails its check, so
+                # good backups are never rotated out for a corrupt one
+                result = dbops.rotate_backups(path, backup_dir, keep)
+                click.echo(f"{start} backup {result['path']} in "
+                           f"{result['seconds']:.1f}s")
+            result = dbops.incremental_vacuum(path)
+            click.echo(f"{start} vacuum freed {result['freed_pages']} pages")
+        except (sqlite3.Error, OSError, RuntimeError) as e:
+            # A locked database or a full disk must not end the job, the
+            # next pass tries again
+            click.echo(f"{start} maintenance failed: {e!r}", err=True)
+            if once:
+                raise click.ClickException(str(e))
+        if once:
+            return
+        time.sleep(interval)
+
+
+@bp.route("/listing-detail")
 def listing_detail():
     listing_id = request.args.get('id')
     listing = Listing.query.get_or_404(listing_id)
+    if current_user.is_authenticated and current_user.id != listing.seller_id:
+        record_view(listing, current_user.id)
 
     images = Image.query.filter_by(listing_id=listing_id).all()
     return render_template("listing_detail.html", listing=listing, images=images)
 
 
-@app.route('/checkout')
+@bp.route('/checkout')
 @login_required
 def checkout():
     listing_id = request.args.get('id')
@@ -261,9 +669,10 @@ def checkout():
 
 
 if __name__ == "__main__":
+    app = create_app()
 
     with app.app_context():
-        db = init_db(app)
+        ensure_schema()
         # Comment out after first run
         # insert_test_data(db=db)
         user = User.get_by_id(1)
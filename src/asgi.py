@@ -0,0 +1,168 @@
+"""
+ASGI entry point for serving the app from one event loop:
+
+    uvicorn asgi:create_application --factory
+
+The I/O bound routes, checkout (waits on Stripe) and the listings API
+(read only), are served natively async so a single process can keep many
+upstream calls in flight. Every other route is passed through to the Flask
+app, which asgiref runs in a thread pool.
+"""
+import asyncio
+import json
+import sys
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+from flask_login import current_user
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import MultiDict
+
+from app import api_listing_page, api_listing_query, create_app
+from model import Listing, ensure_schema
+
+
+async def send_response(send, status, body=b"", content_type=None,
+                        headers=()):
+    response_headers = [(k.encode(), v.encode()) for k, v in headers]
+    if content_type:
+        response_headers.append((b"content-type", content_type.encode()))
+    response_headers.append((b"content-length", str(len(body)).encode()))
+    await send({"type": "http.response.start", "status": status,
+                "headers": response_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_json(send, status, data):
+    await send_response(send, status, json.dumps(data).encode(),
+                        "application/json")
+
+
+class AsyncApplication:
+    """
+    ASGI application wrapping a Flask app built by create_app.
+    """
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.wsgi_application = WsgiToAsgi(app)
+        self.engine = None
+        self.session_factory = None
+        self.routes = {
+            ("POST", "/create_checkout_session"): self.checkout_session,
+            ("GET", "/api/listings"): self.api_listings,
+        }
+
+    def sessionmaker(self) -> async_sessionmaker:
+        """
+        Async engine on the same database as the Flask app, created lazily
+        so it binds to the server's event loop.
+        """
+        if self.session_factory is None:
+            uri = self.app.config["SQLALCHEMY_DATABASE_URI"] \
+                .replace("sqlite://", "sqlite+aiosqlite://", 1)
+            self.engine = create_async_engine(uri)
+            self.session_factory = async_sessionmaker(self.engine,
+                                                      expire_on_commit=False)
+        return self.session_factory
+
+    def user_id(self, scope):
+        """
+        Id of the signed in user, from the Flask session or remember me
+        cookie. Loads the user, so call it from a thread.
+        """
+        headers = [(name.decode("latin-1"), value.decode("latin-1"))
+                   for name, value in scope["headers"]]
+        with self.app.test_request_context(headers=headers):
+            return current_user.get_id() \
+                if current_user.is_authenticated else None
+
+    async def checkout_session(self, scope, receive, send):
+        from stripe_handler import StripeHandler
+
+        form = MultiDict(parse_qsl((await read_body(receive)).decode()))
+        listing = None
+        if form.get("listing_id"):
+            try:
+                listing_id = int(form["listing_id"])
+            except ValueError:
+                await send_json(send, 400, {"message": "Invalid listing"})
+                return
+            async with self.sessionmaker()() as db_session:
+                listing = await db_session.get(Listing, listing_id)
+            if listing is None:
+                await send_json(send, 404, {"message": "Listing not found"})
+                return
+
+        # The buyer the order is recorded for when the payment completes
+        buyer_id = await asyncio.to_thread(self.user_id, scope)
+        with self.app.app_context():
+            session = await StripeHandler() \
+                .create_checkout_session_async(listing, buyer_id)
+        if session is None:
+            await send_json(send, 500,
+                            {"message": "Could not create checkout session"})
+            return
+        await send_response(send, 303, headers=[("location", session.url)])
+
+    async def api_listings(self, scope, receive, send):
+        args = MultiDict(parse_qsl(scope["query_string"].decode()))
+        if args.get("format") == "ndjson":
+            # The streaming export already runs in constant memory, keep it
+            # on the sync path
+            await self.wsgi_application(scope, receive, send)
+            return
+        try:
+            fields, filters, cursor, limit = api_listing_query(args)
+        except ValueError as e:
+            await send_json(send, 400, {"message": str(e)})
+            return
+
+        async with self.sessionmaker()() as session:
+            listings = (await session.scalars(Listing.next_statement(
+                0, limit, filters, [Listing.id], fields, cursor))).all()
+            page = api_listing_page(listings, fields, limit)
+        await send_json(send, 200, page)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # Only close the Stripe client if a request loaded it
+                if "stripe_handler" in sys.modules:
+                    await sys.modules["stripe_handler"] \
+                        .close_async_http_client()
+                if self.engine is not None:
+                    await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] == "http":
+            handler = self.routes.get((scope["method"], scope["path"]))
+            if handler is not None:
+                await handler(scope, receive, send)
+                return
+        await self.wsgi_application(scope, receive, send)
+
+
+def create_application(config: dict = None) -> AsyncApplication:
+    app = create_app(config)
+    with app.app_context():
+        ensure_schema()
+    return AsyncApplication(app)
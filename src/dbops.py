@@ -0,0 +1,222 @@
+import glob
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+# Pages copied per backup step, 256 pages of 4KB is 1MB
+BACKUP_PAGES = 256
+# Seconds to wait between backup steps so writers can get the lock
+BACKUP_PAUSE = 0.01
+# Times a paced backup may be restarted by writes before it copies the rest
+# in one step
+BACKUP_RESTARTS = 3
+# Pages released per incremental vacuum step
+VACUUM_PAGES = 256
+# Seconds to wait between vacuum steps
+VACUUM_PAUSE = 0.01
+# Seconds to wait for a lock held by the web workers
+BUSY_TIMEOUT = 30
+
+
+def connect(path: str) -> sqlite3.Connection:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No database at {path}")
+    return sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+
+
+def pragma(conn: sqlite3.Connection, name: str):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+class BackupRestarted(Exception):
+    """
+    Raised from the progress callback to abort a paced backup that keeps
+    being restarted by writes.
+    """
+
+
+def backup(path: str, destination: str, pages: int = BACKUP_PAGES,
+           pause: float = BACKUP_PAUSE, verify: bool = True,
+           restarts: int = BACKUP_RESTARTS) -> dict:
+    """
+    Copy a live database with SQLite's backup API, ``pages`` at a time.
+    The read lock is only held during a step, so writers wait at most one
+    step. The copy is written next to ``destination`` and renamed into
+    place once complete (and checked, with ``verify``), so a backup file is
+    never torn. A write from another connection between steps makes SQLite
+    start the copy over. After ``restarts`` of those the copy is taken in
+    a single step instead, which blocks writers for the whole copy but
+    always finishes.
+    """
+    partial = destination + ".part"
+    start = time.perf_counter()
+    steps = 0
+    restarted = 0
+    last = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, restarted, last
+        steps += 1
+        # Every step copies pages, so no progress means it started over
+        if last is not None and remaining >= last:
+            restarted += 1
+            if restarted > restarts:
+                raise BackupRestarted()
+        last = remaining
+        if remaining:
+            time.sleep(pause)
+
+    try:
+        copy(path, partial, pages, progress)
+    except BackupRestarted:
+        steps += 1
+        copy(path, partial, -1, None)
+    if verify:
+        problems = integrity_check(partial)
+        if problems:
+            os.remove(partial)
+            raise RuntimeError(f"Backup failed its check: {problems[0]}")
+    os.replace(partial, destination)
+    return {"path": destination, "bytes": os.path.getsize(destination),
+            "steps": steps, "restarts": restarted,
+            "seconds": time.perf_counter() - start}
+
+
+def copy(path: str, destination: str, pages: int, progress):
+    if os.path.exists(destination):
+        os.remove(destination)
+    source = connect(path)
+    target = sqlite3.connect(destination)
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+        source.close()
+
+
+def rotate_backups(path: str, directory: str, keep: int, **options) -> dict:
+    """
+    Write a timestamped backup into ``directory`` and delete all but the
+    ``keep`` newest ones.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.splitext(os.path.basename(path))[0]
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    result = backup(path, os.path.join(directory, f"{name}-{stamp}.db"),
+                    **options)
+    backups = sorted(glob.glob(os.path.join(directory, f"{name}-*.db")))
+    for old in backups[:-keep] if keep else []:
+        os.remove(old)
+    return result
+
+
+def enable_incremental_vacuum(path: str) -> bool:
+    """
+    Switch the database to auto_vacuum=INCREMENTAL. This takes a full
+    VACUUM, which rewrites the file under an exclusive lock, so run it
+    during a quiet period. Returns False if it was already enabled.
+    """
+    conn = connect(path)
+    try:
+        if pragma(conn, "auto_vacuum") == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+
+def incremental_vacuum(path: str, pages: int = VACUUM_PAGES,
+                       pause: float = VACUUM_PAUSE) -> dict:
+    """
+    Return free pages to the file system ``pages`` at a time, each step a
+    short write transaction, then let SQLite refresh its query planner
+    statistics with PRAGMA optimize.
+    """
+    conn = connect(path)
+    try:
+        before = pragma(conn, "freelist_count")
+        incremental = pragma(conn, "auto_vacuum") == 2
+        if incremental:
+            while pragma(conn, "freelist_count"):
+                conn.execute(f"PRAGMA incremental_vacuum({pages})").fetchall()
+                time.sleep(pause)
+        conn.execute("PRAGMA optimize")
+        return {"incremental": incremental, "freed_pages": before -
+                pragma(conn, "freelist_count"),
+                "page_size": pragma(conn, "page_size")}
+    finally:
+        conn.close()
+
+
+def space_report(path: str) -> dict:
+    """
+    File, free list and per table and index sizes. Uses the dbstat table
+    when SQLite was built with it, otherwise estimates table sizes from
+    the length of their values.
+    """
+    conn = connect(path)
+    try:
+        page_size = pragma(conn, "page_size")
+        report = {
+            "bytes": os.path.getsize(path),
+            "page_size": page_size,
+            "pages": pragma(conn, "page_count"),
+            "free_pages": pragma(conn, "freelist_count"),
+            "auto_vacuum": ["none", "full", "incremental"][
+                pragma(conn, "auto_vacuum")],
+            "estimated": False,
+            "objects": [],
+        }
+        tables = dict(conn.execute(
+            "SELECT name, tbl_name FROM sqlite_master "
+            "WHERE type IN ('table', 'index')").fetchall())
+        try:
+            rows = conn.execute(
+                "SELECT name, COUNT(*), SUM(pgsize) FROM dbstat "
+                "GROUP BY name ORDER BY SUM(pgsize) DESC").fetchall()
+        except sqlite3.OperationalError:
+            report["estimated"] = True
+            rows = []
+            for name in conn.execute("SELECT name FROM sqlite_master "
+                                     "WHERE type = 'table'").fetchall():
+                name = name[0]
+                columns = [c[1] for c in conn.execute(
+                    f'PRAGMA table_info("{name}")')]
+                size = " + ".join(f'COALESCE(LENGTH("{c}"), 0)'
+                                  for c in columns)
+                size = conn.execute(
+                    f'SELECT SUM({size}) FROM "{name}"').fetchone()[0] or 0
+                rows.append((name, -(-size // page_size), size))
+            rows.sort(key=lambda row: row[2], reverse=True)
+        for name, pages, size in rows:
+            report["objects"].append({"name": name,
+                                      "table": tables.get(name, name),
+                                      "pages": pages, "bytes": size})
+        return report
+    finally:
+        conn.close()
+
+
+def integrity_check(path: str, full: bool = False) -> list:
+    """
+    Problems found by PRAGMA quick_check, or integrity_check with ``full``
+    (which also checks that indexes match their tables, and is much
+    slower). An empty list means the database is fine.
+    """
+    conn = connect(path)
+    try:
+        check = "integrity_check" if full else "quick_check"
+        problems = [row[0] for row in conn.execute(f"PRAGMA {check}")]
+        return [] if problems == ["ok"] else problems
+    finally:
+        conn.close()
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
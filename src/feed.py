@@ -0,0 +1,241 @@
+import glob
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+from sqlalchemy import create_engine, delete, func, insert, select
+from sqlalchemy.engine import Engine
+
+from model import Image, Listing, db
+
+# Listings shown on a campus feed
+FEED_SIZE = 100
+# Seconds a feed page is served from cache before it is queried again
+FEED_CACHE_SECONDS = 30
+# Filter combinations cached per school
+FEED_CACHE_ENTRIES = 128
+# Schools with cached feeds, the school comes from the query string
+FEED_CACHE_SCHOOLS = 256
+# Pseudo school of the feed spanning every campus
+ALL_CAMPUSES = "all"
+# Shard holding listings whose seller has not set a school
+NO_SCHOOL_SHARD = "_none"
+# Listings copied to the shards per statement
+SYNC_BATCH_SIZE = 500
+
+FEED_COLUMNS = [Listing.id, Listing.seller_id, Listing.name, Listing.price,
+                Listing.post_date, Listing.duration, Listing.start_date,
+                Listing.school]
+# Shards only hold what the feed reads, the main database stays the source
+# of truth for everything else
+SHARD_TABLES = [Listing.__table__, Image.__table__]
+
+
+def shard_name(school) -> str:
+    if not school:
+        return NO_SCHOOL_SHARD
+    return re.sub(r"[^a-z0-9]+", "-", school.lower()).strip("-") \
+        or NO_SCHOOL_SHARD
+
+
+def first_image_ids(listing_ids):
+    return select(func.min(Image.id)) \
+        .where(Image.listing_id.in_(listing_ids)) \
+        .group_by(Image.listing_id)
+
+
+def feed_page(conn, school, filters, size) -> list:
+    """
+    First feed page as dicts, with the first image of each listing as
+    imgsrc. ``conn`` is a session or a connection to a shard. Two queries
+    whatever the page size: the listings, then their first images.
+    """
+    statement = select(*FEED_COLUMNS).filter(*filters)
+    if school != ALL_CAMPUSES:
+        # Matches the (school, post_date) index so the feed reads one range
+        statement = statement.filter(Listing.school == school)
+    statement = statement.order_by(Listing.post_date, Listing.id).limit(size)
+    rows = [dict(row) for row in conn.execute(statement).mappings()]
+    if not rows:
+        return rows
+
+    images = dict(conn.execute(
+        select(Image.listing_id, Image.encoded)
+        .where(Image.id.in_(first_image_ids([row["id"] for row in rows])))
+    ).all())
+    for row in rows:
+        encoded = images.get(row["id"])
+        row["imgsrc"] = f"data:image/;base64,{encoded.decode('utf-8')}" \
+            if encoded else None
+    return rows
+
+
+class SchoolFeed:
+    """
+    Campus scoped listing feeds. Each school's feed is cached for
+    FEED_CACHE_SECONDS per filter combination and dropped when a listing
+    of that school is synced. The cache is per process, so other workers
+    see new listings once their copy expires.
+
+    With SCHOOL_SHARDS set to a directory, every school's listings are also
+    copied to their own SQLite file there, and feeds read from that file
+    only. The all campuses feed queries every shard and merges the pages.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.engines = {}
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("FEED_SIZE", FEED_SIZE)
+        app.config.setdefault("FEED_CACHE_SECONDS", FEED_CACHE_SECONDS)
+        app.config.setdefault("SCHOOL_SHARDS", None)
+        self.app = app
+        app.extensions["feed"] = self
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self.app.config["SCHOOL_SHARDS"])
+
+    def listings(self, school, filters, cache_key) -> list:
+        """
+        Feed page of ``school`` (or ALL_CAMPUSES) matching ``filters``.
+        ``cache_key`` must identify the filters, the query string does (with
+        the seller when their own listings are filtered out).
+        """
+        now = time.monotonic()
+        with self.lock:
+            cached = self.cache.get(school, {}).get(cache_key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        size = self.app.config["FEED_SIZE"]
+        if not self.sharded:
+            rows = feed_page(db.session, school, filters, size)
+        elif school != ALL_CAMPUSES:
+            name = shard_name(school)
+            # Only read shards that sync created, so an unknown school in
+            # the query string does not create a file
+            if name in self.shard_names():
+                with self.shard_engine(name).connect() as conn:
+                    rows = feed_page(conn, school, filters, size)
+            else:
+                rows = []
+        else:
+            rows = self.search_shards(filters, size)
+
+        with self.lock:
+            if school not in self.cache \
+                    and len(self.cache) >= FEED_CACHE_SCHOOLS:
+                self.cache.pop(next(iter(self.cache)))
+            entries = self.cache.setdefault(school, {})
+            if len(entries) >= FEED_CACHE_ENTRIES:
+                entries.pop(next(iter(entries)))
+            entries[cache_key] = \
+                (now + self.app.config["FEED_CACHE_SECONDS"], rows)
+        return rows
+
+    def search_shards(self, filters, size) -> list:
+        """
+        Run the feed query on every shard in parallel and keep the first
+        ``size`` listings of the merged pages.
+        """
+        def search(name):
+            with self.shard_engine(name).connect() as conn:
+                return feed_page(conn, ALL_CAMPUSES, filters, size)
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(thread_name_prefix="feed")
+        rows = [row for page in self.executor.map(search, self.shard_names())
+                for row in page]
+        rows.sort(key=lambda row: (row["post_date"], row["id"]))
+        return rows[:size]
+
+    def invalidate(self, school):
+        with self.lock:
+            self.cache.pop(school, None)
+            self.cache.pop(ALL_CAMPUSES, None)
+
+    def shard_names(self) -> list:
+        pattern = os.path.join(self.app.config["SCHOOL_SHARDS"], "*.db")
+        return sorted(os.path.basename(path)[:-3]
+                      for path in glob.glob(pattern))
+
+    def shard_engine(self, name: str) -> Engine:
+        with self.lock:
+            engine = self.engines.get(name)
+            if engine is None:
+                directory = self.app.config["SCHOOL_SHARDS"]
+                os.makedirs(directory, exist_ok=True)
+                engine = create_engine(
+                    "sqlite:///" + os.path.join(directory, f"{name}.db"))
+                db.metadata.create_all(engine, tables=SHARD_TABLES)
+                self.engines[name] = engine
+        return engine
+
+    def sync(self, listing_ids):
+        """
+        Bring the feeds up to date after the given listings were created or
+        changed: copy them with their first image to their school's shard
+        when sharding, and drop the cached feeds of their schools.
+        """
+        listing_ids = list(listing_ids)
+        schools = set()
+        for start in range(0, len(listing_ids), SYNC_BATCH_SIZE):
+            batch = listing_ids[start:start + SYNC_BATCH_SIZE]
+            if not self.sharded:
+                schools.update(db.session.scalars(
+                    select(Listing.school).where(Listing.id.in_(batch))
+                    .distinct()))
+                continue
+
+            listings = db.session.execute(
+                select(Listing.__table__).where(Listing.id.in_(batch))
+            ).mappings().all()
+            images = db.session.execute(
+                select(Image.__table__)
+                .where(Image.id.in_(first_image_ids(batch)))
+            ).mappings().all()
+            listing_shards = {}
+            for listing in listings:
+                schools.add(listing["school"])
+                listing_shards.setdefault(
+                    shard_name(listing["school"]), []).append(listing)
+            for name, rows in listing_shards.items():
+                ids = {row["id"] for row in rows}
+                with self.shard_engine(name).begin() as conn:
+                    conn.execute(delete(Image.__table__)
+                                 .where(Image.listing_id.in_(ids)))
+                    conn.execute(delete(Listing.__table__)
+                                 .where(Listing.id.in_(ids)))
+                    conn.execute(insert(Listing.__table__), rows)
+                    shard_images = [image for image in images
+                                    if image["listing_id"] in ids]
+                    if shard_images:
+                        conn.execute(insert(Image.__table__), shard_images)
+        for school in schools:
+            self.invalidate(school)
+
+    def rebuild(self) -> int:
+        """
+        Recreate every shard from the main database.
+        """
+        with self.lock:
+            for engine in self.engines.values():
+                engine.dispose()
+            self.engines.clear()
+            self.cache.clear()
+        for name in self.shard_names():
+            os.remove(os.path.join(self.app.config["SCHOOL_SHARDS"],
+                                   f"{name}.db"))
+        listing_ids = db.session.scalars(
+            select(Listing.id).order_by(Listing.id)).all()
+        self.sync(listing_ids)
+        return len(listing_ids)
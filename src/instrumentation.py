@@ -0,0 +1,208 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import (Flask, Response, g, has_app_context, has_request_context,
+                   request)
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Statements slower than this are written to the slow query log
+SLOW_QUERY_MS = 100
+# Requests issuing more statements than this are logged with their
+# slowest statements, which is usually an N+1 loop
+SLOW_REQUEST_QUERIES = 50
+# Slowest statements kept per request
+TOP_STATEMENTS = 5
+
+_counters = []
+
+
+def normalize_sql(statement: str) -> str:
+    """
+    Collapse whitespace and replace literals so the same query with
+    different values is reported once.
+    """
+    sql = re.sub(r"\s+", " ", statement).strip()
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?)", sql)
+    return sql
+
+
+@contextmanager
+def count_queries():
+    """
+    Count every SQL statement executed inside the block.
+
+        with count_queries() as queries:
+            client.get("/")
+        assert len(queries) <= 2
+    """
+    statements = []
+    _counters.append(statements)
+    try:
+        yield statements
+    finally:
+        _counters.remove(statements)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    # On the execution context, not the connection: after_cursor_execute
+    # does not run for a statement that fails
+    context._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    elapsed = time.perf_counter() - context._query_start
+    for statements in _counters:
+        statements.append(statement)
+    if not has_app_context():
+        return
+    stats = g.get("query_stats")
+    if stats is not None:
+        stats.record(statement, elapsed)
+    instrumentation = g.get("instrumentation")
+    if instrumentation and elapsed * 1000 >= instrumentation.slow_query_ms:
+        instrumentation.slow_query(statement, elapsed)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.slowest = []
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.db_time += elapsed
+        self.slowest.append((elapsed, statement))
+        self.slowest.sort(key=lambda s: s[0], reverse=True)
+        del self.slowest[TOP_STATEMENTS:]
+
+
+class Instrumentation:
+    """
+    Per-request query counts, database time and template render time,
+    exposed as debug response headers, a /metrics endpoint and a slow
+    query log.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.slow_queries = 0
+        # Functions returning extra metric lines for /metrics
+        self.collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("SLOW_QUERY_MS", SLOW_QUERY_MS)
+        app.config.setdefault("SLOW_REQUEST_QUERIES", SLOW_REQUEST_QUERIES)
+        app.config.setdefault("QUERY_HEADERS", None)
+        app.config.setdefault("METRICS_ENABLED", True)
+        self.app = app
+        app.extensions["instrumentation"] = self
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        before_render_template.connect(self.before_render, app)
+        template_rendered.connect(self.after_render, app)
+        app.add_url_rule("/metrics", "metrics", self.metrics)
+
+    @property
+    def slow_query_ms(self) -> float:
+        return self.app.config["SLOW_QUERY_MS"]
+
+    def before_request(self):
+        g.request_start = time.perf_counter()
+        g.query_stats = QueryStats()
+        g.instrumentation = self
+
+    def before_render(self, sender, template, context, **extra):
+        g.render_start = time.perf_counter()
+
+    def after_render(self, sender, template, context, **extra):
+        if "render_start" in g and "query_stats" in g:
+            g.query_stats.render_time += time.perf_counter() - g.render_start
+
+    def slow_query(self, statement: str, elapsed: float):
+        with self.lock:
+            self.slow_queries += 1
+        path = request.path if has_request_context() else "-"
+        self.app.logger.warning(f"Slow query ({elapsed * 1000:.1f}ms) "
+                                f"on {path}: {normalize_sql(statement)}")
+
+    def after_request(self, response: Response) -> Response:
+        stats = g.pop("query_stats", None)
+        if stats is None:
+            return response
+        duration = time.perf_counter() - g.request_start
+        endpoint = request.endpoint or "unknown"
+
+        with self.lock:
+            route = self.routes.setdefault(endpoint, {
+                "requests": 0, "queries": 0, "db_seconds": 0.0,
+                "render_seconds": 0.0, "request_seconds": 0.0})
+            route["requests"] += 1
+            route["queries"] += stats.count
+            route["db_seconds"] += stats.db_time
+            route["render_seconds"] += stats.render_time
+            route["request_seconds"] += duration
+
+        if stats.count > self.app.config["SLOW_REQUEST_QUERIES"]:
+            slowest = "\n".join(f"  {elapsed * 1000:.1f}ms {normalize_sql(sql)}"
+                                for elapsed, sql in stats.slowest)
+            self.app.logger.warning(f"{request.path} issued {stats.count} "
+                                    f"queries in {stats.db_time * 1000:.1f}ms, "
+                                    f"slowest:\n{slowest}")
+
+        headers = self.app.config["QUERY_HEADERS"]
+        if headers is None:
+            headers = self.app.debug
+        if headers:
+            response.headers["X-Query-Count"] = str(stats.count)
+            response.headers["X-DB-Time-ms"] = f"{stats.db_time * 1000:.2f}"
+            response.headers["X-Render-Time-ms"] = f"{stats.render_time * 1000:.2f}"
+            response.headers["X-Request-Time-ms"] = f"{duration * 1000:.2f}"
+            if stats.slowest:
+                response.headers["X-Slowest-Query-ms"] = \
+                    f"{stats.slowest[0][0] * 1000:.2f}"
+        return response
+
+    def metrics(self):
+        if not self.app.config["METRICS_ENABLED"]:
+            return Response(status=404)
+        metrics = [
+            ("http_requests_total", "counter", "Requests handled", "requests"),
+            ("db_queries_total", "counter", "SQL statements executed", "queries"),
+            ("db_query_seconds_total", "counter",
+             "Time spent in SQL statements", "db_seconds"),
+            ("template_render_seconds_total", "counter",
+             "Time spent rendering templates", "render_seconds"),
+            ("http_request_seconds_total", "counter",
+             "Time spent handling requests", "request_seconds"),
+        ]
+        lines = []
+        with self.lock:
+            for name, kind, help_text, key in metrics:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for endpoint, route in sorted(self.routes.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {route[key]}')
+            lines.append("# HELP db_slow_queries_total Statements slower "
+                         "than SLOW_QUERY_MS")
+            lines.append("# TYPE db_slow_queries_total counter")
+            lines.append(f"db_slow_queries_total {self.slow_queries}")
+        for collector in self.collectors:
+            lines += collector()
+        return Response("\n".join(lines) + "\n",
+                        mimetype="text/plain; version=0.0.4")
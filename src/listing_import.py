@@ -0,0 +1,193 @@
+import base64
+import csv
+import io
+import json
+import re
+import zipfile
+from datetime import date
+from itertools import islice
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from model import Image, Listing, User, db
+
+# Rows validated and inserted per transaction
+CHUNK_SIZE = 1000
+# Bytes that are not UTF-8, as decoded with errors="surrogateescape"
+UNDECODABLE = re.compile("[\udc80-\udcff]")
+
+
+def detect_format(filename: str) -> str:
+    if filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def iter_rows(stream, fmt: str = "csv"):
+    """
+    Lazily parse an uploaded file, yielding (line number, row) pairs. Rows
+    use the columns name, description, price, listing_type, start_date,
+    duration and images (a ``;`` separated list of archive file names).
+    Lines that cannot be parsed, including lines that are not UTF-8, are
+    yielded as (line number, error message).
+    """
+    if isinstance(stream, io.TextIOBase):
+        text = stream
+    else:
+        # Bad bytes are kept as surrogates and rejected per row below,
+        # rather than failing the whole import halfway through
+        text = io.TextIOWrapper(stream, encoding="utf-8",
+                                errors="surrogateescape", newline="")
+
+    if fmt == "ndjson":
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            if UNDECODABLE.search(line):
+                yield line_number, "Invalid UTF-8"
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, "Invalid JSON"
+                continue
+            if not isinstance(row, dict):
+                yield line_number, "Expected a JSON object"
+                continue
+            yield line_number, row
+    else:
+        reader = csv.DictReader(text)
+        for row in reader:
+            values = [value for value in row.values() if value is not None]
+            # Extra fields are collected in a list under the None key
+            values += row.get(None) or []
+            if any(UNDECODABLE.search(value) for value in values):
+                yield reader.line_num, "Invalid UTF-8"
+                continue
+            yield reader.line_num, row
+
+
+def image_names(images) -> list:
+    """
+    File names from the ``images`` column: a ``;`` separated string, or in
+    NDJSON also a list of strings.
+    """
+    if not images:
+        return []
+    if isinstance(images, str):
+        images = images.split(";")
+    elif not isinstance(images, list) \
+            or not all(isinstance(name, str) for name in images):
+        raise ValueError("Images must be a list of file names or a ; "
+                         "separated string")
+    return [name.strip() for name in images if name.strip()]
+
+
+class ListingImporter:
+    def __init__(self, seller_id: int, images=None, chunk_size: int = CHUNK_SIZE):
+        """
+        images is an optional zip archive (path or file object) holding the
+        pictures referenced by the ``images`` column. Raises ValueError if
+        it is not a zip archive.
+        """
+        self.seller_id = seller_id
+        seller = db.session.get(User, seller_id)
+        self.school = seller.school if seller else None
+        try:
+            self.archive = zipfile.ZipFile(images) if images else None
+        except zipfile.BadZipFile:
+            raise ValueError("The images file is not a zip archive")
+        self.chunk_size = chunk_size
+        self.inserted = 0
+        self.errors = []
+        # Ids of the imported listings, to sync the feeds afterwards
+        self.listing_ids = []
+
+    def run(self, stream, fmt: str = "csv") -> dict:
+        rows = iter_rows(stream, fmt)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+        if self.archive:
+            self.archive.close()
+        return self.summary()
+
+    def summary(self) -> dict:
+        return {"inserted": self.inserted, "errors": self.errors}
+
+    def error(self, line_number: int, message: str):
+        self.errors.append({"line": line_number, "message": message})
+
+    def prepare(self, line_number: int, row):
+        """
+        Turn a parsed row into listing and image column values, or record
+        why it was rejected.
+        """
+        if isinstance(row, str):
+            self.error(line_number, row)
+            return None
+        try:
+            values = Listing.validate(row.get("name"),
+                                      row.get("description"),
+                                      row.get("price"),
+                                      row.get("listing_type"),
+                                      row.get("start_date"),
+                                      row.get("duration"))
+            images = [self.read_image(name)
+                      for name in image_names(row.get("images"))]
+        except (ValueError, TypeError) as e:
+            self.error(line_number, str(e))
+            return None
+        values["seller_id"] = self.seller_id
+        values["school"] = self.school
+        values["post_date"] = date.today()
+        return line_number, values, images
+
+    def read_image(self, name: str) -> dict:
+        if self.archive is None:
+            raise ValueError(f"No image archive for {name}")
+        try:
+            data = self.archive.read(name)
+        except KeyError:
+            raise ValueError(f"Image {name} not found in archive")
+        return {"name": name, "encoded": base64.b64encode(data)}
+
+    def import_chunk(self, chunk):
+        prepared = [p for p in (self.prepare(n, row) for n, row in chunk) if p]
+        if not prepared:
+            return
+        try:
+            listing_ids = self.insert(prepared)
+            db.session.commit()
+            self.inserted += len(prepared)
+            self.listing_ids += listing_ids
+        except SQLAlchemyError:
+            db.session.rollback()
+            # Retry one row at a time so a single bad row only rejects itself
+            for row in prepared:
+                try:
+                    listing_ids = self.insert([row])
+                    db.session.commit()
+                    self.inserted += 1
+                    self.listing_ids += listing_ids
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    self.error(row[0], str(e.orig if hasattr(e, "orig") else e))
+
+    def insert(self, prepared):
+        result = db.session.execute(
+            insert(Listing.__table__).returning(Listing.__table__.c.id,
+                                                sort_by_parameter_order=True),
+            [values for _, values, _ in prepared]
+        )
+        listing_ids = result.scalars().all()
+        image_rows = []
+        for listing_id, (_, _, images) in zip(listing_ids, prepared):
+            for image in images:
+                image_rows.append(dict(image, listing_id=listing_id))
+        if image_rows:
+            db.session.execute(insert(Image.__table__), image_rows)
+        return listing_ids
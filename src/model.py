@@ -1,11 +1,14 @@
+import math
 import os
 from datetime import date, datetime
 from typing import List, Optional
 
-from flask import Flask
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import ForeignKey, Integer, LargeBinary, String
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import (ForeignKey, Index, Integer, LargeBinary, Select,
+                        String, inspect, select, text, update)
+from sqlalchemy.orm import (DeclarativeBase, Mapped, load_only,
+                            mapped_column, selectinload)
 from werkzeug.security import check_password_hash, generate_password_hash
 
 
@@ -24,13 +27,48 @@ def get_db() -> SQLAlchemy:
 
 
 def init_db(app: Flask) -> SQLAlchemy:
-    app.config["SQLALCHEMY_DATABASE_URI"] = DB_PATH
+    """
+    Register the database with the app. No connection is opened here, see
+    ensure_schema.
+    """
+    app.config.setdefault("SQLALCHEMY_DATABASE_URI", DB_PATH)
     db.init_app(app)
-    with app.app_context():
-        db.create_all()
     return db
 
 
+def ensure_schema():
+    """
+    Create missing tables and add missing nullable columns and indexes to
+    existing ones, so models can gain optional columns without a migration
+    tool. New SQLite files use incremental auto vacuum so ``flask db vacuum``
+    can shrink them without a full VACUUM. Must be called inside an app
+    context. The engine's connections are closed afterwards so a server
+    that calls this before forking workers does not share SQLite
+    connections with them.
+    """
+    with db.engine.begin() as conn:
+        if db.engine.dialect.name == "sqlite":
+            # Only takes effect before the first table is created
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        db.metadata.create_all(conn)
+    inspector = inspect(db.engine)
+    # Quotes reserved names such as the order table
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                    f"{preparer.format_column(column)} {column_type}"))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    db.engine.dispose()
+
+
 class User(db.Model):
     id: Mapped[int] = mapped_column(primary_key=True)
     email: Mapped[str] = mapped_column(unique=True)
@@ -67,6 +105,10 @@ class User(db.Model):
     def get_cart_items(self) -> List['CartItem']:
         return CartItem.query.filter(CartItem.client_id == self.id).all()
 
+    @property
+    def is_admin(self):
+        return self.email in current_app.config.get("ADMIN_EMAILS", [])
+
     @property
     def is_active(self):
         return True  # All users are active by default
@@ -83,19 +125,90 @@ class User(db.Model):
         return str(self.id)  # Convert to string as Flask-Login expects
 
 
+# Fields that can be requested through the listings API. Columns not
+# requested are never loaded, so image blobs and descriptions are skipped
+# unless asked for.
+LISTING_FIELDS = ["id", "seller_id", "name", "description", "price",
+                  "post_date", "duration", "start_date", "school", "images"]
+DEFAULT_LISTING_FIELDS = ["id", "seller_id", "name", "price", "post_date",
+                          "duration", "start_date"]
+
+
 class Listing(db.Model):
     id: Mapped[int] = mapped_column(primary_key=True)
-    seller_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    seller_id: Mapped[int] = mapped_column(ForeignKey("user.id"), index=True)
     name: Mapped[str]
     description: Mapped[str]
     price: Mapped[float]
     post_date: Mapped[date]
     duration: Mapped[Optional[int]]
     start_date: Mapped[Optional[date]]
+    # Copy of the seller's school so campus feeds are a single index range
+    school: Mapped[Optional[str]]
 
     seller = db.relationship('User', backref='listings')
     images = db.relationship('Image', backref='listing')
 
+    __table_args__ = (
+        Index("ix_listing_school_post_date", "school", "post_date"),
+    )
+
+    @staticmethod
+    def backfill_schools() -> int:
+        """
+        Set school on listings created before it was stored on the listing.
+        """
+        seller_school = select(User.school) \
+            .where(User.id == Listing.seller_id) \
+            .scalar_subquery()
+        result = db.session.execute(
+            update(Listing)
+            .where(Listing.school.is_(None))
+            .values(school=seller_school)
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def validate(name, description, price, listing_type=None,
+                 start_date=None, duration=None) -> dict:
+        """
+        Check user supplied listing fields and convert them to column values.
+        Raises ValueError with a message suitable for showing to the user.
+        """
+        if not name or not description or price in (None, ""):
+            raise ValueError("All fields are required")
+
+        try:
+            price = float(price)
+        except ValueError:
+            raise ValueError("Invalid price")
+        # inf is not valid JSON and nan cannot be stored
+        if not math.isfinite(price):
+            raise ValueError("Invalid price")
+        if price < 0:
+            raise ValueError("Price cannot be less than 0")
+
+        if listing_type != "renting":
+            return {"name": name, "description": description, "price": price,
+                    "duration": None, "start_date": None}
+
+        if not start_date or not duration:
+            raise ValueError("Start date and duration are required for rentals")
+        try:
+            duration = int(duration)
+        except ValueError:
+            raise ValueError("Invalid duration")
+        if duration <= 0:
+            raise ValueError("Duration must be a positive integer")
+        try:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError("Invalid start date")
+
+        return {"name": name, "description": description, "price": price,
+                "duration": duration, "start_date": start_date}
+
     @staticmethod
     # Condition isn't actually a type, but is of the form
     # MyClass.field == "value"
@@ -103,14 +216,57 @@ class Listing(db.Model):
         page: int = 0,
         page_size: int = 20,
         conditions: List['Condition'] = [],  # type: ignore
-        orderings: List['Ordering'] = []  # type: ignore
+        orderings: List['Ordering'] = [],  # type: ignore
+        fields: Optional[List[str]] = None,
+        after: Optional[int] = None
     ) -> List['Self']:  # type: ignore
-        return Listing.query \
-            .filter(*conditions) \
+        return db.session.scalars(Listing.next_statement(
+            page, page_size, conditions, orderings, fields, after)).all()
+
+    @staticmethod
+    def next_statement(page, page_size, conditions, orderings, fields=None,
+                       after=None) -> Select:
+        """
+        The SELECT behind get_next, so it can also run on an async session.
+        """
+        statement = Listing.select_fields(fields).filter(*conditions)
+        # Cursor pagination: only rows past the last id the client saw
+        if after is not None:
+            statement = statement.filter(Listing.id > after)
+        return statement \
             .order_by(*orderings) \
             .offset(page * page_size) \
-            .limit(page_size) \
-            .all()
+            .limit(page_size)
+
+    @staticmethod
+    def select_fields(fields: Optional[List[str]] = None) -> Select:
+        """
+        Build a listing SELECT that only loads the given fields.
+        """
+        statement = select(Listing)
+        if fields is None:
+            return statement
+        # id is always loaded so rows can be paginated and serialized
+        columns = [Listing.id]
+        columns += [getattr(Listing, f) for f in fields
+                    if f not in ("id", "images")]
+        statement = statement.options(load_only(*columns))
+        if "images" in fields:
+            statement = statement.options(selectinload(Listing.images))
+        return statement
+
+    def to_dict(self, fields: List[str] = DEFAULT_LISTING_FIELDS) -> dict:
+        result = {}
+        for field in fields:
+            value = getattr(self, field)
+            if field == "images":
+                value = [{"name": image.name,
+                          "encoded": image.encoded.decode('utf-8')}
+                         for image in value]
+            elif isinstance(value, date):
+                value = value.isoformat()
+            result[field] = value
+        return result
 
 
 class Order(db.Model):
@@ -119,6 +275,15 @@ class Order(db.Model):
     buyer_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
     seller_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
     date: Mapped[date]
+    # Price paid, the listing price can change after the sale
+    amount: Mapped[Optional[float]]
+    # Stripe checkout session that paid for the order, so a payment is only
+    # recorded once
+    checkout_session: Mapped[Optional[str]]
+
+    __table_args__ = (
+        Index("ix_order_checkout_session", "checkout_session", unique=True),
+    )
 
 
 class CartItem(db.Model):
@@ -132,6 +297,32 @@ class Interactions(db.Model):
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
     listing_id: Mapped[int] = mapped_column(ForeignKey("listing.id"))
     interaction: Mapped[str]
+    date: Mapped[Optional[date]]
+
+
+class ListingStats(db.Model):
+    """
+    Running totals per listing, updated with every order and view. See
+    stats.py.
+    """
+    listing_id: Mapped[int] = mapped_column(ForeignKey("listing.id"),
+                                            primary_key=True)
+    seller_id: Mapped[int] = mapped_column(ForeignKey("user.id"), index=True)
+    views: Mapped[int] = mapped_column(default=0)
+    sales: Mapped[int] = mapped_column(default=0)
+    revenue: Mapped[float] = mapped_column(default=0.0)
+
+
+class SellerDailyStats(db.Model):
+    """
+    Running totals per seller and day, updated with every order and view.
+    """
+    seller_id: Mapped[int] = mapped_column(ForeignKey("user.id"),
+                                           primary_key=True)
+    day: Mapped[date] = mapped_column(primary_key=True)
+    views: Mapped[int] = mapped_column(default=0)
+    sales: Mapped[int] = mapped_column(default=0)
+    revenue: Mapped[float] = mapped_column(default=0.0)
 
 
 class Categories(db.Model):
@@ -142,7 +333,8 @@ class Categories(db.Model):
 
 class Image(db.Model):
     id: Mapped[int] = mapped_column(primary_key=True)
-    listing_id: Mapped[int] = mapped_column(ForeignKey("listing.id"))
+    listing_id: Mapped[int] = mapped_column(ForeignKey("listing.id"),
+                                            index=True)
     name: Mapped[str]
     encoded: Mapped[LargeBinary] = mapped_column(LargeBinary, nullable=False)
 
@@ -0,0 +1,216 @@
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Flask, Response, abort, jsonify, request
+from flask_login import current_user
+
+# Seconds between stack samples while profiling is active
+SAMPLE_INTERVAL = 0.005
+# Functions listed per route by /admin/profiler/top
+TOP_FUNCTIONS = 20
+# Longest a profile runs, a stop request may reach a different worker
+MAX_DURATION = 300
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Opt-in sampling profiler. While active, a fraction of requests is
+    registered with a background thread that periodically records the
+    stack of each registered request thread. Stacks are aggregated per
+    endpoint and can be downloaded in collapsed format for flamegraph
+    tools. When inactive, the only cost per request is one attribute check.
+
+    State is per process. Behind several workers each admin request reaches
+    one of them, so every profile stops by itself after at most
+    PROFILER_MAX_DURATION seconds.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.lock = threading.Lock()
+        self.active = False
+        self.rate = 1.0
+        self.until = 0
+        self.interval = SAMPLE_INTERVAL
+        self.threads = {}
+        self.stacks = defaultdict(Counter)
+        self.stop_event = threading.Event()
+        self.sampler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("PROFILER_INTERVAL", SAMPLE_INTERVAL)
+        app.config.setdefault("PROFILER_MAX_DURATION", MAX_DURATION)
+        self.app = app
+        app.extensions["profiler"] = self
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule("/admin/profiler/start", "profiler_start",
+                         self.start_view, methods=["POST"])
+        app.add_url_rule("/admin/profiler/stop", "profiler_stop",
+                         self.stop_view, methods=["POST"])
+        app.add_url_rule("/admin/profiler/reset", "profiler_reset",
+                         self.reset_view, methods=["POST"])
+        app.add_url_rule("/admin/profiler/collapsed", "profiler_collapsed",
+                         self.collapsed_view)
+        app.add_url_rule("/admin/profiler/top", "profiler_top",
+                         self.top_view)
+
+    def start(self, rate: float = 1.0, duration: float = None) -> float:
+        """
+        Profile ``rate`` of requests for ``duration`` seconds, at most
+        PROFILER_MAX_DURATION. Returns the duration used.
+        """
+        limit = self.app.config["PROFILER_MAX_DURATION"]
+        # Also catches nan, which min() would let through
+        duration = duration if duration and 0 < duration < limit else limit
+        self.rate = rate
+        self.until = time.monotonic() + duration
+        self.interval = self.app.config["PROFILER_INTERVAL"]
+        if self.active:
+            return duration
+        # A fresh event per run so a sampler that is still winding down
+        # from a previous stop() cannot be revived
+        self.stop_event = threading.Event()
+        self.active = True
+        self.sampler = threading.Thread(target=self.sample_loop,
+                                        args=(self.stop_event,),
+                                        name="profiler", daemon=True)
+        self.sampler.start()
+        return duration
+
+    def stop(self):
+        self.active = False
+        self.stop_event.set()
+        self.threads.clear()
+
+    def reset(self):
+        with self.lock:
+            self.stacks.clear()
+
+    def before_request(self):
+        if not self.active:
+            return
+        if random.random() < self.rate:
+            self.threads[threading.get_ident()] = request.endpoint or "unknown"
+
+    def teardown_request(self, exc):
+        if self.threads:
+            self.threads.pop(threading.get_ident(), None)
+
+    def sample_loop(self, stop_event: threading.Event):
+        while not stop_event.wait(self.interval):
+            if time.monotonic() > self.until:
+                self.stop()
+                return
+            self.sample()
+
+    def sample(self):
+        frames = sys._current_frames()
+        for ident, endpoint in list(self.threads.items()):
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            if not stack:
+                continue
+            stack.reverse()
+            with self.lock:
+                self.stacks[endpoint][";".join(stack)] += 1
+
+    def collapsed(self, endpoint: str = None) -> str:
+        """
+        Stacks in the collapsed format read by flamegraph.pl and speedscope,
+        rooted at the endpoint name.
+        """
+        lines = []
+        with self.lock:
+            for name, stacks in sorted(self.stacks.items()):
+                if endpoint and name != endpoint:
+                    continue
+                for stack, count in stacks.items():
+                    lines.append(f"{name};{stack} {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def top(self, n: int = TOP_FUNCTIONS) -> dict:
+        """
+        Per endpoint, the functions seen in the most samples. ``self`` is the
+        share of samples where the function was running, ``total`` the share
+        where it was anywhere on the stack.
+        """
+        result = {}
+        with self.lock:
+            for endpoint, stacks in self.stacks.items():
+                samples = sum(stacks.values())
+                own, total = Counter(), Counter()
+                for stack, count in stacks.items():
+                    frames = stack.split(";")
+                    own[frames[-1]] += count
+                    for name in set(frames):
+                        total[name] += count
+                result[endpoint] = {
+                    "samples": samples,
+                    "functions": [
+                        {"function": name,
+                         "self": round(own[name] / samples * 100, 1),
+                         "total": round(count / samples * 100, 1)}
+                        for name, count in sorted(
+                            total.items(), key=lambda f: (-own[f[0]], -f[1]))[:n]
+                    ],
+                }
+        return result
+
+    def check_admin(self):
+        if not current_user.is_authenticated or not current_user.is_admin:
+            abort(403)
+
+    def start_view(self):
+        self.check_admin()
+        try:
+            rate = float(request.form.get("rate", 1.0))
+            duration = request.form.get("duration")
+            duration = float(duration) if duration else None
+        except ValueError:
+            return jsonify({"message": "Invalid rate or duration"}), 400
+        # nan fails every comparison, so it is caught by these too
+        if not 0 < rate <= 1:
+            return jsonify({"message": "Rate must be between 0 and 1"}), 400
+        if duration is not None and not 0 < duration < math.inf:
+            return jsonify({"message": "Duration must be a positive number "
+                                       "of seconds"}), 400
+        duration = self.start(rate, duration)
+        # Which worker is profiling, the other workers are not
+        return jsonify({"active": True, "rate": rate, "duration": duration,
+                        "pid": os.getpid()})
+
+    def stop_view(self):
+        self.check_admin()
+        self.stop()
+        return jsonify({"active": False})
+
+    def reset_view(self):
+        self.check_admin()
+        self.reset()
+        return jsonify({"message": "Profile cleared"})
+
+    def collapsed_view(self):
+        self.check_admin()
+        return Response(self.collapsed(request.args.get("endpoint")),
+                        mimetype="text/plain")
+
+    def top_view(self):
+        self.check_admin()
+        n = request.args.get("n", TOP_FUNCTIONS, type=int)
+        return jsonify(self.top(n))
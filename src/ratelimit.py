@@ -0,0 +1,259 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import Flask, g, jsonify, request
+from flask_login import current_user
+
+# endpoint -> rule. A rule only applies to the listed methods, and when
+# ``args`` is given only to requests carrying one of those query arguments.
+# Each limit is (key, requests, seconds): a token bucket per key value
+# holding ``requests`` tokens and refilling them over ``seconds``. Keys are
+# "ip", "user" (signed in users only) or "ip_email" (the address together
+# with the submitted email, so guessing one account's password is slowed
+# down without letting others lock that account out from their own
+# address). ``concurrency`` caps how many of these requests a worker
+# handles at once.
+DEFAULT_RULES = {
+    "main.login": {"methods": ["POST"], "concurrency": 4,
+                   "limits": [("ip", 20, 60), ("ip_email", 5, 60)]},
+    "main.signup": {"methods": ["POST"], "concurrency": 2,
+                    "limits": [("ip", 5, 3600)]},
+    "main.createlisting": {"methods": ["POST"], "concurrency": 4,
+                           "limits": [("user", 30, 3600), ("ip", 60, 3600)]},
+    "main.listings": {"args": ["search"], "concurrency": 8,
+                      "limits": [("ip", 60, 60), ("user", 60, 60)]},
+}
+# Seconds clients are told to wait when a route is at its concurrency limit
+BUSY_RETRY_AFTER = 1
+# Buckets kept in memory before refilled ones are dropped
+MAX_BUCKETS = 100_000
+
+
+class MemoryBackend:
+    """
+    Token buckets in this process. Each worker enforces the limits on its
+    own share of the traffic.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def take(self, key: str, capacity: int, rate: float) -> float:
+        """
+        Take a token from the bucket. Returns 0 if one was available,
+        otherwise the seconds until one will be.
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated, _ = self.buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            retry_after = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / rate
+            if len(self.buckets) >= MAX_BUCKETS:
+                self.prune(now)
+            self.buckets[key] = \
+                (tokens, now, now + (capacity - tokens) / rate)
+        return retry_after
+
+    def prune(self, now: float):
+        # A full bucket is the same as no bucket
+        for key, (_, _, full_at) in list(self.buckets.items()):
+            if full_at <= now:
+                del self.buckets[key]
+
+
+class SQLiteBackend:
+    """
+    Token buckets in a SQLite file shared by every worker on the host, so
+    limits hold across processes. Each take is one short write
+    transaction.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.takes = 0
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE IF NOT EXISTS bucket (key TEXT "
+                         "PRIMARY KEY, tokens REAL NOT NULL, updated REAL "
+                         "NOT NULL, full_at REAL NOT NULL)")
+            self.local.conn = conn
+        return conn
+
+    def take(self, key: str, capacity: int, rate: float) -> float:
+        # Wall clock, monotonic clocks are not shared between processes
+        now = time.time()
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM bucket "
+                               "WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            retry_after = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / rate
+            conn.execute("INSERT INTO bucket VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT (key) DO UPDATE SET "
+                         "tokens = excluded.tokens, "
+                         "updated = excluded.updated, "
+                         "full_at = excluded.full_at",
+                         (key, tokens, now, now + (capacity - tokens) / rate))
+            self.takes += 1
+            if self.takes % 1000 == 0:
+                conn.execute("DELETE FROM bucket WHERE full_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+class RateLimiter:
+    """
+    Admission control for the expensive routes: token bucket rate limits
+    per client and a cap on concurrent requests per route. Rejected
+    requests get an immediate 429 (over the rate) or 503 (route busy) with
+    Retry-After, so a burst is shed at the door instead of queueing up
+    behind the KDF or the LIKE scan and slowing every request down.
+    Rejections are exported on /metrics.
+    """
+
+    def __init__(self, app: Flask = None):
+        self.lock = threading.Lock()
+        self.backend = None
+        self.semaphores = {}
+        self.in_flight = Counter()
+        self.rejections = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("RATELIMIT_ENABLED", True)
+        app.config.setdefault("RATELIMIT_RULES", DEFAULT_RULES)
+        # None keeps buckets in memory, a file path shares them between
+        # the workers on this host
+        app.config.setdefault("RATELIMIT_STORAGE", None)
+        self.app = app
+        app.extensions["ratelimit"] = self
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        instrumentation = app.extensions.get("instrumentation")
+        if instrumentation is not None:
+            instrumentation.collectors.append(self.metric_lines)
+
+    def get_backend(self):
+        # Created on first use so the storage file is opened by the worker,
+        # not by a master process before forking
+        if self.backend is None:
+            storage = self.app.config["RATELIMIT_STORAGE"]
+            self.backend = SQLiteBackend(storage) if storage \
+                else MemoryBackend()
+        return self.backend
+
+    def rule(self):
+        rule = self.app.config["RATELIMIT_RULES"].get(request.endpoint)
+        if rule is None:
+            return None
+        if "methods" in rule and request.method not in rule["methods"]:
+            return None
+        if "args" in rule and not any(request.args.get(arg)
+                                      for arg in rule["args"]):
+            return None
+        return rule
+
+    def key(self, kind: str):
+        if kind == "ip":
+            return request.remote_addr
+        if kind == "user":
+            return current_user.get_id() \
+                if current_user.is_authenticated else None
+        if kind == "ip_email":
+            email = request.form.get("email")
+            return f"{request.remote_addr}:{email.strip().lower()}" \
+                if email else None
+        raise ValueError(f"Unknown rate limit key {kind}")
+
+    def reject(self, status: int, reason: str, retry_after: float):
+        with self.lock:
+            self.rejections[(request.endpoint, reason)] += 1
+        message = "Too many requests" if status == 429 \
+            else "Server busy, try again shortly"
+        response = jsonify({"message": message})
+        response.status_code = status
+        response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def before_request(self):
+        if not self.app.config["RATELIMIT_ENABLED"]:
+            return None
+        rule = self.rule()
+        if rule is None:
+            return None
+
+        for kind, requests, seconds in rule.get("limits", []):
+            value = self.key(kind)
+            if value is None:
+                continue
+            try:
+                retry_after = self.get_backend().take(
+                    f"{request.endpoint}:{kind}:{value}", requests,
+                    requests / seconds)
+            except sqlite3.Error as e:
+                # Fail open, the limiter must not take the site down
+                self.app.logger.error(f"Rate limit storage error: {e}")
+                retry_after = 0
+            if retry_after:
+                return self.reject(429, "rate", retry_after)
+
+        limit = rule.get("concurrency")
+        if limit:
+            with self.lock:
+                semaphore = self.semaphores.setdefault(
+                    request.endpoint, threading.BoundedSemaphore(limit))
+            if not semaphore.acquire(blocking=False):
+                return self.reject(503, "concurrency", BUSY_RETRY_AFTER)
+            g.admission_slot = semaphore
+            with self.lock:
+                self.in_flight[request.endpoint] += 1
+        return None
+
+    def teardown_request(self, exc):
+        semaphore = g.pop("admission_slot", None)
+        if semaphore is not None:
+            semaphore.release()
+            with self.lock:
+                self.in_flight[request.endpoint] -= 1
+
+    def metric_lines(self) -> list:
+        lines = ["# HELP ratelimit_rejections_total Requests rejected by "
+                 "admission control",
+                 "# TYPE ratelimit_rejections_total counter"]
+        with self.lock:
+            for (endpoint, reason), count in sorted(self.rejections.items()):
+                lines.append(f'ratelimit_rejections_total{{endpoint='
+                             f'"{endpoint}",reason="{reason}"}} {count}')
+            lines.append("# HELP ratelimit_in_flight Requests being handled "
+                         "on concurrency limited routes")
+            lines.append("# TYPE ratelimit_in_flight gauge")
+            for endpoint, count in sorted(self.in_flight.items()):
+                lines.append(f'ratelimit_in_flight{{endpoint="{endpoint}"}} '
+                             f'{count}')
+        return lines
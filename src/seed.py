@@ -0,0 +1,98 @@
+import base64
+import random
+from datetime import date, timedelta
+from itertools import islice
+
+from sqlalchemy import func, insert, select
+from werkzeug.security import generate_password_hash
+
+from model import Image, Listing, User, db
+
+# Rows per executemany call
+BATCH_SIZE = 5000
+
+SCHOOLS = ["MIT", "Harvard", "Stanford", "Berkeley", "University of Vermont",
+           "Middlebury", "Dartmouth", "Cornell", "Yale", "Brown", None]
+FIRST_NAMES = ["Drew", "Jordan", "Levi", "Caroline", "River", "Surya", "Alex",
+               "Sam", "Taylor", "Morgan", "Casey", "Jamie", "Riley", "Avery"]
+LAST_NAMES = ["Jepsen", "Bourdeau", "Pare", "Palecek", "Bumpas", "Malik",
+              "Nguyen", "Garcia", "Smith", "Chen", "Okafor", "Silva", "Kim"]
+ADJECTIVES = ["Used", "Like new", "Vintage", "Barely used", "Refurbished",
+              "Compact", "Large", "Ergonomic", "Wireless", "Classic"]
+ITEMS = ["MacBook Pro", "Calculus Textbook", "Desk Chair", "iPhone",
+         "Physics Notes", "Mini Fridge", "Scientific Calculator", "Desk Lamp",
+         "Lab Coat", "Laptop Stand", "Bike", "Futon", "Monitor", "Backpack",
+         "Rug", "Microwave", "Headphones", "Winter Jacket", "Skis", "Kettle"]
+
+
+def batched(rows, size: int = BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def seed_database(users: int, listings: int, images: int, seed: int = 0,
+                  password: str = "password123") -> dict:
+    """
+    Insert a synthetic but realistic dataset of the given size. The same
+    seed always produces the same rows, so runs can be compared.
+    Every generated user shares ``password`` (hashed once, since hashing
+    per user would dominate the run time).
+    """
+    # Listings need sellers and images need listings
+    listings = listings if users else 0
+    images = images if listings else 0
+    rng = random.Random(seed)
+    hashed_password = generate_password_hash(password)
+    first_user = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    first_listing = (db.session.scalar(select(func.max(Listing.id))) or 0) + 1
+    today = date.today()
+    # School of each generated user, copied onto their listings
+    schools = []
+
+    def user_row(i):
+        schools.append(rng.choice(SCHOOLS))
+        return {"id": first_user + i,
+                "email": f"user{first_user + i}@example.com",
+                "school": schools[i],
+                "first_name": rng.choice(FIRST_NAMES),
+                "last_name": rng.choice(LAST_NAMES),
+                "hashed_password": hashed_password}
+
+    for batch in batched(user_row(i) for i in range(users)):
+        db.session.execute(insert(User.__table__), batch)
+
+    def listing_row(i):
+        renting = rng.random() < 0.2
+        item = rng.choice(ITEMS)
+        post_date = today - timedelta(days=rng.randrange(90))
+        seller = rng.randrange(users)
+        return {"id": first_listing + i,
+                "seller_id": first_user + seller,
+                "school": schools[seller],
+                "name": f"{rng.choice(ADJECTIVES)} {item}",
+                "description": f"{item} in good condition, pick up on campus.",
+                # Roughly one in twenty listings is free
+                "price": 0.0 if rng.random() < 0.05
+                else round(rng.uniform(1, 1000), 2),
+                "post_date": post_date,
+                "duration": rng.choice([7, 14, 30]) if renting else None,
+                "start_date": post_date if renting else None}
+
+    for batch in batched(listing_row(i) for i in range(listings)):
+        db.session.execute(insert(Listing.__table__), batch)
+
+    def image_row(i):
+        size = rng.randrange(1024, 8192)
+        return {"listing_id": first_listing + rng.randrange(listings),
+                "name": f"image{i}.jpg",
+                "encoded": base64.b64encode(rng.randbytes(size))}
+
+    for batch in batched((image_row(i) for i in range(images)), 500):
+        db.session.execute(insert(Image.__table__), batch)
+
+    db.session.commit()
+    return {"users": users, "listings": listings, "images": images}
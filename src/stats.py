@@ -0,0 +1,154 @@
+from datetime import date, timedelta
+
+from sqlalchemy import delete, func, insert, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert as upsert
+from sqlalchemy.exc import IntegrityError
+
+from model import (Interactions, Listing, ListingStats, Order,
+                   SellerDailyStats, db)
+
+# Interaction recorded when a signed in user opens a listing
+VIEW = "view"
+# Days shown on the seller dashboard
+DASHBOARD_DAYS = 30
+
+
+def bump(listing_id: int, seller_id: int, day: date, views: int = 0,
+         sales: int = 0, revenue: float = 0.0):
+    """
+    Add to the running totals of a listing and of its seller's day, in the
+    caller's transaction.
+    """
+    rows = [(ListingStats, {"listing_id": listing_id, "seller_id": seller_id}),
+            (SellerDailyStats, {"seller_id": seller_id, "day": day})]
+    for model, key in rows:
+        statement = upsert(model).values(**key, views=views, sales=sales,
+                                         revenue=revenue)
+        statement = statement.on_conflict_do_update(
+            index_elements=[c.name for c in model.__table__.primary_key],
+            set_={"views": model.views + statement.excluded.views,
+                  "sales": model.sales + statement.excluded.sales,
+                  "revenue": model.revenue + statement.excluded.revenue})
+        db.session.execute(statement)
+
+
+def record_view(listing: Listing, user_id: int):
+    today = date.today()
+    db.session.add(Interactions(user_id=user_id, listing_id=listing.id,
+                                interaction=VIEW, date=today))
+    bump(listing.id, listing.seller_id, today, views=1)
+    db.session.commit()
+
+
+def record_order(listing: Listing, buyer_id: int, amount: float = None,
+                 checkout_session: str = None):
+    """
+    Save an order and add it to the seller's totals. Returns None if the
+    checkout session was already recorded.
+    """
+    amount = listing.price if amount is None else amount
+    order = Order(listing_id=listing.id, buyer_id=buyer_id,
+                  seller_id=listing.seller_id, date=date.today(),
+                  amount=amount, checkout_session=checkout_session)
+    try:
+        db.session.add(order)
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    bump(listing.id, listing.seller_id, order.date, sales=1, revenue=amount)
+    db.session.commit()
+    return order
+
+
+def rebuild_stats() -> dict:
+    """
+    Recompute both summary tables from the orders and view history with
+    two INSERT ... SELECT statements, replacing whatever they held.
+    """
+    amount = func.coalesce(Order.amount, Listing.price)
+    views = select(Interactions.listing_id,
+                   func.count().label("views"),
+                   literal(0).label("sales"),
+                   literal(0.0).label("revenue")) \
+        .where(Interactions.interaction == VIEW) \
+        .group_by(Interactions.listing_id)
+    orders = select(Order.listing_id, literal(0), func.count(),
+                    func.sum(amount)) \
+        .join(Listing, Listing.id == Order.listing_id) \
+        .group_by(Order.listing_id)
+    per_listing = union_all(views, orders).subquery()
+
+    daily_views = select(Listing.seller_id,
+                         Interactions.date.label("day"),
+                         func.count().label("views"),
+                         literal(0).label("sales"),
+                         literal(0.0).label("revenue")) \
+        .join(Listing, Listing.id == Interactions.listing_id) \
+        .where(Interactions.interaction == VIEW,
+               Interactions.date.is_not(None)) \
+        .group_by(Listing.seller_id, Interactions.date)
+    daily_orders = select(Order.seller_id, Order.date, literal(0),
+                          func.count(), func.sum(amount)) \
+        .join(Listing, Listing.id == Order.listing_id) \
+        .group_by(Order.seller_id, Order.date)
+    per_day = union_all(daily_views, daily_orders).subquery()
+
+    db.session.execute(delete(ListingStats))
+    db.session.execute(delete(SellerDailyStats))
+    listings = db.session.execute(insert(ListingStats).from_select(
+        ["listing_id", "seller_id", "views", "sales", "revenue"],
+        select(per_listing.c.listing_id, Listing.seller_id,
+               func.sum(per_listing.c.views), func.sum(per_listing.c.sales),
+               func.sum(per_listing.c.revenue))
+        .join(Listing, Listing.id == per_listing.c.listing_id)
+        .group_by(per_listing.c.listing_id, Listing.seller_id)))
+    days = db.session.execute(insert(SellerDailyStats).from_select(
+        ["seller_id", "day", "views", "sales", "revenue"],
+        select(per_day.c.seller_id, per_day.c.day,
+               func.sum(per_day.c.views), func.sum(per_day.c.sales),
+               func.sum(per_day.c.revenue))
+        .group_by(per_day.c.seller_id, per_day.c.day)))
+    db.session.commit()
+    return {"listings": listings.rowcount, "days": days.rowcount}
+
+
+def conversion(views: int, sales: int):
+    return round(sales / views * 100, 1) if views else None
+
+
+def seller_dashboard(seller_id: int, days: int = DASHBOARD_DAYS) -> dict:
+    """
+    Per listing and per day totals of a seller, read from the summary
+    tables only.
+    """
+    listings = []
+    rows = db.session.execute(
+        select(Listing.id, Listing.name, Listing.price,
+               func.coalesce(ListingStats.views, 0).label("views"),
+               func.coalesce(ListingStats.sales, 0).label("sales"),
+               func.coalesce(ListingStats.revenue, 0.0).label("revenue"))
+        .outerjoin(ListingStats, ListingStats.listing_id == Listing.id)
+        .where(Listing.seller_id == seller_id)
+        .order_by(Listing.id)).mappings()
+    for row in rows:
+        listings.append(dict(row, conversion=conversion(row["views"],
+                                                        row["sales"])))
+
+    since = date.today() - timedelta(days=days - 1)
+    daily = []
+    for row in db.session.scalars(
+            select(SellerDailyStats)
+            .where(SellerDailyStats.seller_id == seller_id,
+                   SellerDailyStats.day >= since)
+            .order_by(SellerDailyStats.day.desc())):
+        daily.append({"day": row.day, "views": row.views, "sales": row.sales,
+                      "revenue": row.revenue,
+                      "conversion": conversion(row.views, row.sales)})
+
+    views = sum(row["views"] for row in listings)
+    sales = sum(row["sales"] for row in listings)
+    totals = {"views": views, "sales": sales,
+              "revenue": sum(row["revenue"] for row in listings),
+              "conversion": conversion(views, sales)}
+    return {"listings": listings, "days": daily, "totals": totals}
@@ -1,7 +1,5 @@
+import asyncio
 import os
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 
 import stripe
 from dotenv import load_dotenv
@@ -17,6 +15,37 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 
+# One httpx client shared by every async call so connections to Stripe are
+# pooled instead of opened per request. Created on first use.
+_async_http_client = None
+# StripeClient per (api key, api base), building one is not free
+_async_stripe_clients = {}
+
+
+def async_http_client() -> stripe.HTTPXClient:
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = stripe.HTTPXClient()
+    return _async_http_client
+
+
+def async_stripe_client(api_key: str) -> stripe.StripeClient:
+    key = (api_key, stripe.api_base)
+    if key not in _async_stripe_clients:
+        _async_stripe_clients[key] = stripe.StripeClient(
+            api_key,
+            base_addresses={"api": stripe.api_base},
+            http_client=async_http_client())
+    return _async_stripe_clients[key]
+
+
+async def close_async_http_client():
+    global _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.close_async()
+        _async_http_client = None
+        _async_stripe_clients.clear()
+
 
 class StripeHandler:
     def __init__(self):
@@ -107,23 +136,44 @@ class StripeHandler:
                 f"Stripe Error (create_customer_session): {e}")
             return None
 
-    def create_checkout_session(self):
+    def async_client(self) -> stripe.StripeClient:
+        return async_stripe_client(self.api_key)
+
+    def checkout_session_params(self, listing=None, buyer_id=None):
         DOMAIN = "https://localhost:5000"
+        params = {
+            "payment_method_types": ['card'],
+            "mode": "payment",
+            "line_items": [{
+                "price_data": {
+                    "currency": "usd",
+                    "product_data": {"name": "NEED TO FILL"},
+                    "unit_amount": 1000,  # $10.00 in cents, will change as needed
+                },
+                "quantity": 1,
+            }],
+            "success_url": DOMAIN + '/payment_success',
+            "cancel_url": DOMAIN + '/payment_cancel',
+        }
+        if listing is not None:
+            params["line_items"][0]["price_data"].update({
+                "product_data": {"name": listing.name},
+                "unit_amount": round(listing.price * 100),
+            })
+            params["metadata"] = {"listing_id": str(listing.id)}
+            # Stripe fills in the session id, payment_success records the
+            # order from it
+            params["success_url"] += "?session_id={CHECKOUT_SESSION_ID}"
+        if buyer_id is not None:
+            # The order is recorded for this user, whoever opens the
+            # success page
+            params["client_reference_id"] = str(buyer_id)
+        return params
+
+    def create_checkout_session(self, listing=None, buyer_id=None):
         try:
             session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                mode="payment",
-                line_items=[{
-                    "price_data": {
-                        "currency": "usd",
-                        "product_data": {"name": "NEED TO FILL"},
-                        "unit_amount": 1000,  # $10.00 in cents, will change as needed
-                    },
-                    "quantity": 1,
-                }],
-                success_url=DOMAIN + '/payment_success',
-                cancel_url=DOMAIN + '/payment_cancel',
-            )
+                **self.checkout_session_params(listing, buyer_id))
 
         except StripeError as e:
             current_app.logger.error(
@@ -131,6 +181,18 @@ class StripeHandler:
             return None
         return redirect(session.url, code=303)
 
+    async def create_checkout_session_async(self, listing=None,
+                                            buyer_id=None):
+        # Returns the session rather than a redirect, the caller builds the
+        # response
+        try:
+            return await self.async_client().checkout.sessions.create_async(
+                params=self.checkout_session_params(listing, buyer_id))
+        except StripeError as e:
+            current_app.logger.error(
+                f"Stripe Error (create_checkout_session_async): {e}")
+            return None
+
     def check_checkout_session(self, session_id):
         try:
             session = stripe.checkout.Session.retrieve(session_id)
@@ -141,12 +203,31 @@ class StripeHandler:
                 f"Stripe Error (check_checkout_session): {e}")
             return None
 
-    def handle_payment(self, session):
-        # if the payment is successful, send the user a confirmation email, do not handle unsuccessful payments
-        if not EMAIL_USER or not EMAIL_PASS or not SMTP_SERVER or not SMTP_PORT:
+    async def check_checkout_session_async(self, session_id):
+        try:
+            session = await self.async_client().checkout.sessions \
+                .retrieve_async(session_id)
+            return (session, session.status)
+        except StripeError as e:
             current_app.logger.error(
-                "EMAIL_USER or EMAIL_PASS or SMTP_SERVER or SMTP_PORT is not set")
+                f"Stripe Error (check_checkout_session_async): {e}")
+            return None
+
+    @staticmethod
+    def webhook_event(payload: bytes, signature, secret: str):
+        # Returns None if the payload was not signed with the secret
+        try:
+            return stripe.Webhook.construct_event(payload, signature, secret)
+        except (ValueError, stripe.SignatureVerificationError) as e:
+            current_app.logger.error(f"Stripe webhook rejected: {e}")
             return None
+
+    def payment_email(self, session):
+        # Only payment handling sends email, keep smtplib and the email
+        # package out of the checkout path
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
         customer_email = session["customer_email"]
         product_price = session["amount_total"]
         message = MIMEMultipart()
@@ -162,21 +243,53 @@ class StripeHandler:
             <p>Thank you for your purchase!</p>
             """
         ))
+        return message
+
+    def send_email(self, message):
+        import smtplib
+
+        try:
+            current_app.logger.info(f"Sending email to {message["To"]}")
+            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+                server.starttls()
+                server.login(EMAIL_USER, EMAIL_PASS)
+                server.sendmail(message["From"],
+                                message["To"], message.as_string())
+                current_app.logger.info(f"Email sent to {message["To"]}")
+            return True
+        except Exception as e:
+            current_app.logger.error(f"Error sending email: {e}")
+            return False
+
+    def email_configured(self):
+        if not EMAIL_USER or not EMAIL_PASS or not SMTP_SERVER or not SMTP_PORT:
+            current_app.logger.error(
+                "EMAIL_USER or EMAIL_PASS or SMTP_SERVER or SMTP_PORT is not set")
+            return False
+        return True
+
+    def handle_payment(self, session):
+        # if the payment is successful, send the user a confirmation email, do not handle unsuccessful payments
+        if not self.email_configured():
+            return None
+        message = self.payment_email(session)
         session = self.check_checkout_session(session["id"])
         if session is not None and session[1] == "complete":
             # send the email
-            try:
-                current_app.logger.info(f"Sending email to {customer_email}")
-                with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-                    server.starttls()
-                    server.login(EMAIL_USER, EMAIL_PASS)
-                    server.sendmail(message["From"],
-                                    message["To"], message.as_string())
-                    current_app.logger.info(f"Email sent to {customer_email}")
-                return True
-            except Exception as e:
-                current_app.logger.error(f"Error sending email: {e}")
-                return False
+            return self.send_email(message)
+        else:
+            current_app.logger.info(f"Payment not successful")
+            return False
+
+    async def handle_payment_async(self, session):
+        if not self.email_configured():
+            return None
+        message = self.payment_email(session)
+        session = await self.check_checkout_session_async(session["id"])
+        if session is not None and session[1] == "complete":
+            # smtplib blocks, run it in a thread so the event loop keeps
+            # serving other requests
+            return await asyncio.to_thread(self.send_email, message)
         else:
             current_app.logger.info(f"Payment not successful")
             return False
@@ -0,0 +1,16 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn --preload -w 4 wsgi:app
+
+The app is built and the schema checked once in the master process;
+workers are forked with everything already imported and no open database
+connections.
+"""
+from app import create_app
+from model import ensure_schema
+
+app = create_app()
+
+with app.app_context():
+    ensure_schema()
@@ -0,0 +1,60 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+# The app imports its modules by bare name (``from model import ...``)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), "src"))
+
+
+@pytest.fixture
+def app():
+    from app import create_app
+
+    return create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite://"})
+
+
+@pytest.fixture
+def client(app):
+    from model import db
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+
+
+@pytest.fixture
+def login():
+    """
+    Sign a test client in, returning the response.
+
+        login(client, "user@example.com")
+    """
+    def sign_in(client, email, password="password123"):
+        return client.post("/login",
+                           data={"email": email, "password": password})
+
+    return sign_in
+
+
+@pytest.fixture
+def max_queries():
+    """
+    Fail the test if the block issues more than ``limit`` SQL statements.
+
+        with max_queries(2):
+            client.get("/api/listings")
+    """
+    from instrumentation import count_queries
+
+    @contextmanager
+    def check(limit):
+        with count_queries() as statements:
+            yield statements
+        assert len(statements) <= limit, \
+            f"{len(statements)} queries (max {limit}):\n" + "\n".join(statements)
+
+    return check
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, inspect, text
+
+from app import create_app
+from model import db, ensure_schema
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), "src")
+
+
+def test_create_app_is_lazy():
+    # A fresh interpreter, other tests may already have imported stripe
+    code = ("import sys; from app import create_app; create_app(); "
+            "print('stripe' in sys.modules, 'smtplib' in sys.modules)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ["False", "False"]
+
+
+def test_apps_are_independent():
+    first = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite://"})
+    second = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+    assert first.extensions["profiler"] is not second.extensions["profiler"]
+    assert not second.testing
+    assert "main.listings" in second.view_functions
+
+
+def test_ensure_schema_adds_columns(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(uri)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE user (id INTEGER PRIMARY KEY, "
+                          "email VARCHAR NOT NULL, first_name VARCHAR NOT NULL, "
+                          "last_name VARCHAR NOT NULL, "
+                          "hashed_password VARCHAR NOT NULL)"))
+        # Reserved word, must be quoted
+        conn.execute(text('CREATE TABLE "order" (id INTEGER PRIMARY KEY, '
+                          "listing_id INTEGER NOT NULL, buyer_id INTEGER NOT NULL, "
+                          "seller_id INTEGER NOT NULL, date DATE NOT NULL)"))
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": uri})
+    with app.app_context():
+        ensure_schema()
+        ensure_schema()
+
+    columns = {c["name"] for c in inspect(engine).get_columns("user")}
+    assert "school" in columns
+    columns = {c["name"] for c in inspect(engine).get_columns("order")}
+    assert "amount" in columns
+    assert set(inspect(engine).get_table_names()) >= set(db.metadata.tables)
+    engine.dispose()
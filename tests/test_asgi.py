@@ -0,0 +1,105 @@
+import asyncio
+from datetime import date
+
+import httpx
+import pytest
+import stripe
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import stripe_handler
+from model import Listing, User, db
+
+
+@pytest.fixture
+def setUp(app, client, tmp_path, monkeypatch):
+    from asgi import AsyncApplication
+
+    # The async routes read from their own engine, point it at a file
+    # database both engines can see
+    path = tmp_path / "asgi.db"
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [{
+            "id": 1, "email": "a@example.com", "first_name": "A",
+            "last_name": "B", "hashed_password": "x"}])
+        conn.execute(insert(Listing.__table__), [{
+            "seller_id": 1, "name": f"Item {i}", "description": "",
+            "price": 10.0, "post_date": date(2025, 1, 1)} for i in range(3)])
+    engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    application = AsyncApplication(app)
+    application.session_factory = async_sessionmaker(async_engine)
+    monkeypatch.setenv("STRIPE_SECRET_KEY", "sk_test_123")
+    yield application
+    asyncio.run(async_engine.dispose())
+
+
+def request(application, method, url, headers=None):
+    async def send():
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url="http://testserver") as c:
+            return await c.request(method, url, headers=headers)
+    return asyncio.run(send())
+
+
+def test_api_listings_async(setUp):
+    response = request(setUp, "GET", "/api/listings?limit=2")
+    assert response.status_code == 200
+    data = response.json()
+    assert [l["name"] for l in data["listings"]] == ["Item 0", "Item 1"]
+    assert data["next_cursor"] == 2
+
+    response = request(setUp, "GET", "/api/listings?fields=bad")
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def stripe_requests(monkeypatch):
+    requests = []
+
+    def handler(http_request):
+        requests.append(http_request)
+        return httpx.Response(200, json={
+            "id": "cs_test_1", "object": "checkout.session",
+            "status": "open", "url": "https://checkout.stripe.com/pay/cs_test_1"})
+
+    client = stripe.HTTPXClient()
+    client._client_async = httpx.AsyncClient(
+        transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(stripe_handler, "_async_http_client", client)
+    monkeypatch.setattr(stripe_handler, "_async_stripe_clients", {})
+    return requests
+
+
+def test_checkout_async(setUp, stripe_requests):
+    response = request(setUp, "POST", "/create_checkout_session")
+    assert response.status_code == 303
+    assert response.headers["location"] == \
+        "https://checkout.stripe.com/pay/cs_test_1"
+    assert stripe_requests[0].url.path == "/v1/checkout/sessions"
+    assert b"client_reference_id" not in stripe_requests[0].content
+
+
+def test_checkout_async_buyer(app, setUp, stripe_requests, login):
+    user = User(email="buyer@example.com", first_name="A", last_name="B")
+    user.password = "password123"
+    db.session.add(user)
+    db.session.commit()
+    flask_client = app.test_client()
+    login(flask_client, "buyer@example.com")
+    cookie = flask_client.get_cookie("session").value
+
+    response = request(setUp, "POST", "/create_checkout_session",
+                       {"cookie": f"session={cookie}"})
+    assert response.status_code == 303
+    assert f"client_reference_id={user.id}".encode() \
+        in stripe_requests[0].content
+
+
+def test_other_routes_use_flask(setUp):
+    response = request(setUp, "GET", "/login")
+    assert response.status_code == 200
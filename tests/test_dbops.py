@@ -0,0 +1,215 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import dbops
+from model import Image, User, db, ensure_schema
+
+
+@pytest.fixture
+def setUp(tmp_path):
+    from app import create_app
+
+    path = str(tmp_path / "app.db")
+    app = create_app({"TESTING": True,
+                      "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+    with app.app_context():
+        ensure_schema()
+        user = User(email="user@example.com", first_name="A", last_name="B")
+        user.password = "password123"
+        db.session.add(user)
+        db.session.add_all(Image(listing_id=1, name="photo.jpg",
+                                 encoded=os.urandom(4096))
+                           for _ in range(200))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+    return app, path
+
+
+def delete_images(path):
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM image")
+    conn.commit()
+    conn.close()
+
+
+def test_new_databases_use_incremental_vacuum(setUp):
+    _, path = setUp
+    assert dbops.space_report(path)["auto_vacuum"] == "incremental"
+
+
+def test_backup(setUp, tmp_path):
+    _, path = setUp
+    destination = str(tmp_path / "copy.db")
+    result = dbops.backup(path, destination, pages=8, pause=0)
+    assert result["steps"] > 1
+    assert not os.path.exists(destination + ".part")
+    assert dbops.integrity_check(destination) == []
+    conn = sqlite3.connect(destination)
+    assert conn.execute("SELECT COUNT(*) FROM image").fetchone()[0] == 200
+    conn.close()
+
+
+def test_backup_while_writing(setUp, tmp_path):
+    _, path = setUp
+    stop = threading.Event()
+
+    def write():
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        while not stop.is_set():
+            conn.execute("INSERT INTO user (email, first_name, last_name, "
+                         "hashed_password) VALUES (?, 'A', 'B', 'x')",
+                         (f"{time.perf_counter()}@example.com",))
+            time.sleep(0.002)
+        conn.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        result = dbops.backup(path, str(tmp_path / "copy.db"), pages=8,
+                              pause=0.01)
+    finally:
+        stop.set()
+        writer.join()
+    # Restarted by the writes, then finished in one step
+    assert result["restarts"] > dbops.BACKUP_RESTARTS
+    assert dbops.integrity_check(result["path"]) == []
+
+
+def test_backup_rotation(setUp, tmp_path):
+    _, path = setUp
+    directory = tmp_path / "backups"
+    os.makedirs(directory)
+    for stamp in ("20250101-000000", "20250102-000000", "20250103-000000"):
+        (directory / f"app-{stamp}.db").write_bytes(b"")
+    result = dbops.rotate_backups(path, str(directory), 2, pause=0)
+    assert sorted(os.listdir(directory)) == \
+        ["app-20250103-000000.db", os.path.basename(result["path"])]
+
+
+def test_report_and_vacuum(setUp):
+    _, path = setUp
+    report = dbops.space_report(path)
+    image = next(o for o in report["objects"] if o["name"] == "image")
+    assert image["bytes"] > 200 * 4096
+    assert report["free_pages"] == 0
+
+    delete_images(path)
+    report = dbops.space_report(path)
+    assert report["free_pages"] > 200
+
+    result = dbops.incremental_vacuum(path, pages=50, pause=0)
+    assert result["incremental"]
+    assert result["freed_pages"] == report["free_pages"]
+    assert os.path.getsize(path) < report["bytes"]
+
+
+def test_enable_incremental_vacuum(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (data BLOB)")
+    conn.executemany("INSERT INTO t VALUES (?)",
+                     [(os.urandom(4096),) for _ in range(50)])
+    conn.execute("DELETE FROM t")
+    conn.commit()
+    conn.close()
+
+    assert not dbops.incremental_vacuum(path)["incremental"]
+    assert dbops.enable_incremental_vacuum(path)
+    assert not dbops.enable_incremental_vacuum(path)
+    report = dbops.space_report(path)
+    assert report["auto_vacuum"] == "incremental"
+    assert report["free_pages"] == 0
+
+
+def test_cli(setUp, tmp_path):
+    app, path = setUp
+    delete_images(path)
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=["db", "check", "--full"])
+    assert result.exit_code == 0
+    assert result.output == "ok\n"
+
+    result = runner.invoke(args=["db", "report"])
+    assert result.exit_code == 0
+    assert "image" in result.output
+    assert "auto vacuum incremental" in result.output
+
+    backups = tmp_path / "backups"
+    result = runner.invoke(args=["db", "maintain", "--once", "--backup-dir",
+                                 str(backups)])
+    assert result.exit_code == 0, result.output
+    assert len(os.listdir(backups)) == 1
+    assert dbops.space_report(path)["free_pages"] == 0
+
+
+def test_maintain_checks_backup_only(setUp, tmp_path, monkeypatch):
+    app, path = setUp
+    checked = []
+    integrity_check = dbops.integrity_check
+
+    def check(target, full=False):
+        checked.append(target)
+        return integrity_check(target, full)
+
+    monkeypatch.setattr(dbops, "integrity_check", check)
+    result = app.test_cli_runner().invoke(args=[
+        "db", "maintain", "--once", "--backup-dir", str(tmp_path / "backups")])
+    assert result.exit_code == 0, result.output
+    # Only the fresh copy, not the live database
+    assert len(checked) == 1
+    assert checked[0] != path and checked[0].endswith(".db.part")
+
+
+def test_maintain_keeps_backups_on_failed_check(setUp, tmp_path,
+                                                monkeypatch):
+    app, path = setUp
+    backups = tmp_path / "backups"
+    os.makedirs(backups)
+    (backups / "app-20250101-000000.db").write_bytes(b"")
+    monkeypatch.setattr(dbops, "integrity_check",
+                        lambda target, full=False: ["page 2 is never used"])
+    result = app.test_cli_runner().invoke(args=[
+        "db", "maintain", "--once", "--backup-dir", str(backups),
+        "--keep", "1"])
+    assert result.exit_code != 0
+    assert "Backup failed its check" in result.output
+    assert os.listdir(backups) == ["app-20250101-000000.db"]
+
+
+def test_cli_requires_file(app):
+    result = app.test_cli_runner().invoke(args=["db", "check"])
+    assert result.exit_code != 0
+    assert "Only SQLite database files" in result.output
+
+
+def test_maintain_survives_errors(setUp, monkeypatch):
+    import app as app_module
+
+    app, _ = setUp
+    passes = []
+
+    class Stop(Exception):
+        pass
+
+    def vacuum(path):
+        passes.append(path)
+        if len(passes) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return {"freed_pages": 0}
+
+    def sleep(seconds):
+        if len(passes) == 2:
+            raise Stop()
+
+    monkeypatch.setattr(dbops, "incremental_vacuum", vacuum)
+    monkeypatch.setattr(app_module.time, "sleep", sleep)
+    result = app.test_cli_runner().invoke(args=["db", "maintain"])
+    assert isinstance(result.exception, Stop)
+    assert "maintenance failed" in result.output
+    assert "vacuum freed 0 pages" in result.output
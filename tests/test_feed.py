@@ -0,0 +1,141 @@
+import io
+from datetime import date
+
+import pytest
+from sqlalchemy import select, text
+
+import feed as feed_module
+from model import Image, Listing, User, db
+
+
+@pytest.fixture
+def setUp(app, client):
+    for email, school in [("uvm@example.com", "University of Vermont"),
+                          ("mit@example.com", "MIT"),
+                          ("buyer@example.com", "University of Vermont")]:
+        user = User(email=email, first_name="A", last_name="B", school=school)
+        user.password = "password123"
+        db.session.add(user)
+    db.session.commit()
+    for i, (seller_id, school) in enumerate(
+            [(1, "University of Vermont"), (1, "University of Vermont"),
+             (2, "MIT")]):
+        db.session.add(Listing(seller_id=seller_id, name=f"Item {i}",
+                               description="", price=10.0,
+                               post_date=date(2025, 1, i + 1), school=school))
+    db.session.commit()
+    db.session.add(Image(listing_id=3, name="a.jpg", encoded=b"aGVsbG8="))
+    db.session.commit()
+    return client
+
+
+def feed_names(client, query=""):
+    body = client.get("/" + query).get_data(as_text=True)
+    return [f"Item {i}" for i in range(10) if f"Item {i}<" in body]
+
+
+def test_feed_scoped_to_school(setUp, login):
+    assert feed_names(setUp) == ["Item 0", "Item 1", "Item 2"]
+    login(setUp, "buyer@example.com")
+    assert feed_names(setUp) == ["Item 0", "Item 1"]
+    assert feed_names(setUp, "?school=MIT") == ["Item 2"]
+    assert feed_names(setUp, "?school=all") == ["Item 0", "Item 1", "Item 2"]
+
+
+def test_own_listings_hidden(setUp, login):
+    login(setUp, "uvm@example.com")
+    assert feed_names(setUp) == []
+
+
+def test_own_listings_do_not_crowd_out_feed(app, setUp, login):
+    app.config["FEED_SIZE"] = 2
+    # More own listings than fit on a page, all older than the buyer's
+    db.session.add(Listing(seller_id=1, name="Item 7", description="",
+                           price=10.0, post_date=date(2024, 1, 1),
+                           school="University of Vermont"))
+    db.session.add(Listing(seller_id=3, name="Item 8", description="",
+                           price=10.0, post_date=date(2025, 3, 1),
+                           school="University of Vermont"))
+    db.session.commit()
+    login(setUp, "uvm@example.com")
+    assert feed_names(setUp) == ["Item 8"]
+    # Other users still get the shared page
+    with app.app_context():
+        buyer = app.test_client()
+        login(buyer, "buyer@example.com")
+        assert feed_names(buyer) == ["Item 0", "Item 7"]
+
+
+def test_new_listing_clears_cache(app, setUp, login):
+    feed = app.extensions["feed"]
+    login(setUp, "uvm@example.com")
+    feed_names(setUp)
+    assert "University of Vermont" in feed.cache
+
+    response = setUp.post("/create-listing", data={
+        "name": "Lamp", "description": "Desk lamp", "price": "5",
+        "listingType": "selling",
+        "images": (io.BytesIO(b"image"), "lamp.jpg")})
+    assert response.status_code == 302
+    listing = db.session.scalars(
+        select(Listing).where(Listing.name == "Lamp")).one()
+    assert listing.school == "University of Vermont"
+    assert "University of Vermont" not in feed.cache
+
+
+def test_school_index_used(setUp):
+    plan = db.session.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM listing WHERE school = 'MIT' "
+        "ORDER BY post_date LIMIT 10")).all()
+    assert "ix_listing_school_post_date" in " ".join(row[-1] for row in plan)
+
+
+def test_backfill_schools(setUp):
+    db.session.add(Listing(seller_id=2, name="Old", description="",
+                           price=1.0, post_date=date(2024, 1, 1)))
+    db.session.commit()
+    Listing.backfill_schools()
+    old = db.session.scalars(select(Listing).where(Listing.name == "Old")).one()
+    assert old.school == "MIT"
+
+
+def test_shards(app, setUp, tmp_path):
+    app.config["SCHOOL_SHARDS"] = str(tmp_path)
+    feed = app.extensions["feed"]
+    assert feed.rebuild() == 3
+    assert feed.shard_names() == ["mit", "university-of-vermont"]
+
+    # Feeds are served from the shards only
+    db.session.execute(text("DELETE FROM listing"))
+    assert feed_names(setUp, "?school=MIT") == ["Item 2"]
+    assert feed_names(setUp) == ["Item 0", "Item 1", "Item 2"]
+    rows = feed.listings("MIT", [], b"school=MIT")
+    assert rows[0]["imgsrc"] == "data:image/;base64,aGVsbG8="
+
+    db.session.rollback()
+    db.session.add(Listing(seller_id=2, name="Item 5", description="",
+                           price=10.0, post_date=date(2025, 2, 1),
+                           school="MIT"))
+    db.session.commit()
+    feed.sync([4])
+    assert feed_names(setUp, "?school=MIT") == ["Item 2", "Item 5"]
+    assert feed_names(setUp, "?school=all") == \
+        ["Item 0", "Item 1", "Item 2", "Item 5"]
+
+
+def test_unknown_school_creates_no_shard(app, setUp, tmp_path):
+    app.config["SCHOOL_SHARDS"] = str(tmp_path)
+    feed = app.extensions["feed"]
+    feed.rebuild()
+    assert feed_names(setUp, "?school=zzz1") == []
+    assert feed_names(setUp, "?school=../../tmp/evil") == []
+    assert feed.shard_names() == ["mit", "university-of-vermont"]
+    assert set(feed.engines) <= {"mit", "university-of-vermont"}
+
+
+def test_cached_schools_capped(app, setUp, monkeypatch):
+    monkeypatch.setattr(feed_module, "FEED_CACHE_SCHOOLS", 2)
+    feed = app.extensions["feed"]
+    for school in ("a", "b", "c"):
+        feed_names(setUp, f"?school={school}")
+    assert list(feed.cache) == ["b", "c"]
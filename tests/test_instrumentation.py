@@ -0,0 +1,71 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from instrumentation import normalize_sql
+from model import Image, Listing, User, db
+
+
+@pytest.fixture
+def setUp(app, client):
+    seller = User(email="seller@example.com", first_name="Sam",
+                  last_name="Seller", school="UVM", hashed_password="x")
+    db.session.add(seller)
+    db.session.commit()
+    for i in range(3):
+        db.session.add(Listing(seller_id=seller.id, name=f"Item {i}",
+                               description="", price=5.0,
+                               post_date=date(2025, 1, 1)))
+    db.session.commit()
+    db.session.add(Image(listing_id=1, name="a.jpg", encoded=b"aGVsbG8="))
+    db.session.commit()
+    app.config["QUERY_HEADERS"] = True
+    return client
+
+
+def test_normalize_sql():
+    sql = """SELECT * FROM listing
+             WHERE name = 'it''s' AND price > 10.5 AND id IN (1, 2, 3)"""
+    assert normalize_sql(sql) == \
+        "SELECT * FROM listing WHERE name = ? AND price > ? AND id IN (?)"
+
+
+def test_debug_headers(setUp):
+    response = setUp.get("/listing-detail?id=1")
+    assert response.status_code == 200
+    assert int(response.headers["X-Query-Count"]) > 0
+    assert float(response.headers["X-DB-Time-ms"]) > 0
+    assert float(response.headers["X-Render-Time-ms"]) > 0
+
+
+def test_metrics(setUp):
+    setUp.get("/api/listings")
+    body = setUp.get("/metrics").get_data(as_text=True)
+    assert 'http_requests_total{endpoint="main.api_listings"}' in body
+    assert 'db_queries_total{endpoint="main.api_listings"}' in body
+    assert "db_slow_queries_total" in body
+
+
+def test_route_query_budgets(setUp, max_queries):
+    with max_queries(1):
+        setUp.get("/api/listings")
+    with max_queries(4):
+        setUp.get("/listing-detail?id=1")
+    # Listings and their first images, whatever the number of listings
+    with max_queries(2):
+        setUp.get("/")
+
+
+def test_failed_statements(setUp, max_queries):
+    connection = db.session.connection()
+    for _ in range(3):
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+    db.session.rollback()
+    assert "query_start" not in db.session.connection().info
+    # Statements after a failure are still timed and counted
+    with max_queries(1) as statements:
+        db.session.execute(text("SELECT 1"))
+    assert statements == ["SELECT 1"]
@@ -0,0 +1,150 @@
+import io
+import zipfile
+
+import pytest
+
+from listing_import import ListingImporter
+from model import Image, Listing, User, db
+
+CSV = b"""name,description,price,listing_type,start_date,duration,images
+Desk,Wooden desk,40,selling,,,desk.jpg
+Bike,Road bike,-5,selling,,,
+Tent,Two person tent,15,renting,2025-05-01,7,tent.jpg;desk.jpg
+Lamp,,10,selling,,,
+Kayak,Red kayak,30,renting,2025-06-01,,
+Chair,Folding chair,0,selling,,,missing.jpg
+"""
+
+
+@pytest.fixture
+def setUp(client):
+    user = User(email="store@example.com", first_name="Campus",
+                last_name="Store", school="UVM")
+    user.password = "password123"
+    db.session.add(user)
+    db.session.commit()
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("desk.jpg", b"desk")
+        z.writestr("tent.jpg", b"tent")
+    archive.seek(0)
+    return client, user, archive
+
+
+def test_import_csv(setUp):
+    _, user, archive = setUp
+    summary = ListingImporter(user.id, images=archive, chunk_size=2) \
+        .run(io.BytesIO(CSV), "csv")
+
+    assert summary["inserted"] == 2
+    assert [e["line"] for e in summary["errors"]] == [3, 5, 6, 7]
+    assert summary["errors"][0]["message"] == "Price cannot be less than 0"
+    assert summary["errors"][3]["message"] == "Image missing.jpg not found in archive"
+
+    tent = Listing.query.filter_by(name="Tent").one()
+    assert tent.seller_id == user.id
+    assert tent.duration == 7
+    assert sorted(i.name for i in tent.images) == ["desk.jpg", "tent.jpg"]
+    assert Image.query.count() == 3
+
+
+def test_import_ndjson(setUp):
+    _, user, _ = setUp
+    data = b'{"name": "Mug", "description": "Blue mug", "price": 3}\n' \
+        b'not json\n' \
+        b'\n' \
+        b'{"name": "Rug", "description": "Big rug", "price": "x"}\n'
+    summary = ListingImporter(user.id).run(io.BytesIO(data), "ndjson")
+
+    assert summary["inserted"] == 1
+    assert summary["errors"] == [{"line": 2, "message": "Invalid JSON"},
+                                 {"line": 4, "message": "Invalid price"}]
+
+
+def test_import_invalid_utf8(setUp):
+    _, user, _ = setUp
+    data = b"name,description,price\n" \
+        b"Desk,Wooden desk,40\n" \
+        b"Bad,\xff\xfe,10\n" \
+        b"Lamp,Desk lamp,5\n"
+    summary = ListingImporter(user.id).run(io.BytesIO(data), "csv")
+    assert summary["inserted"] == 2
+    assert summary["errors"] == [{"line": 3, "message": "Invalid UTF-8"}]
+
+    data = b'{"name": "Mug", "description": "\xff", "price": 3}\n' \
+        b'{"name": "Rug", "description": "Big rug", "price": 5}\n'
+    summary = ListingImporter(user.id).run(io.BytesIO(data), "ndjson")
+    assert summary["inserted"] == 1
+    assert summary["errors"] == [{"line": 1, "message": "Invalid UTF-8"}]
+
+
+def test_import_non_finite_price(setUp):
+    _, user, _ = setUp
+    data = b"name,description,price\nA,a,inf\nB,b,nan\nC,c,1e400\n"
+    summary = ListingImporter(user.id).run(io.BytesIO(data), "csv")
+    assert summary["inserted"] == 0
+    assert [e["message"] for e in summary["errors"]] == ["Invalid price"] * 3
+
+
+def test_import_ndjson_image_lists(setUp):
+    _, user, archive = setUp
+    data = b'{"name": "Mug", "description": "Blue mug", "price": 3, ' \
+        b'"images": ["desk.jpg", "tent.jpg"]}\n' \
+        b'{"name": "Rug", "description": "Big rug", "price": 5, ' \
+        b'"images": {"a": 1}}\n' \
+        b'{"name": "Cup", "description": "Red cup", "price": 1, ' \
+        b'"images": "desk.jpg"}\n'
+    summary = ListingImporter(user.id, images=archive) \
+        .run(io.BytesIO(data), "ndjson")
+
+    assert summary["inserted"] == 2
+    assert [e["line"] for e in summary["errors"]] == [2]
+    mug = Listing.query.filter_by(name="Mug").one()
+    assert sorted(i.name for i in mug.images) == ["desk.jpg", "tent.jpg"]
+
+
+def test_import_bad_archive(setUp, login):
+    client, _, _ = setUp
+    login(client, "store@example.com")
+    response = client.post("/import-listings", data={
+        "listings": (io.BytesIO(CSV), "listings.csv"),
+        "images": (io.BytesIO(b"not a zip"), "images.zip"),
+    })
+    assert response.status_code == 400
+    assert Listing.query.count() == 0
+
+
+def test_import_command_bad_archive(tmp_path):
+    from app import create_app
+
+    # The command checks the schema, which closes an in memory database
+    app = create_app({"SQLALCHEMY_DATABASE_URI":
+                      f"sqlite:///{tmp_path / 'app.db'}"})
+    listings, images = tmp_path / "listings.csv", tmp_path / "images.zip"
+    listings.write_bytes(CSV)
+    images.write_bytes(b"not a zip")
+    with app.app_context():
+        db.create_all()
+        user = User(email="store@example.com", first_name="Campus",
+                    last_name="Store")
+        user.password = "password123"
+        db.session.add(user)
+        db.session.commit()
+        result = app.test_cli_runner().invoke(args=[
+            "import-listings", str(listings), "--seller",
+            "store@example.com", "--images", str(images)])
+    assert result.exit_code == 1
+    assert "not a zip archive" in result.output
+
+
+def test_import_route(setUp, login):
+    client, _, archive = setUp
+    login(client, "store@example.com")
+    response = client.post("/import-listings", data={
+        "listings": (io.BytesIO(CSV), "listings.csv"),
+        "images": (archive, "images.zip"),
+    })
+    assert response.status_code == 200
+    assert response.get_json()["inserted"] == 2
+    assert Listing.query.count() == 2
@@ -0,0 +1,111 @@
+import json
+import sqlite3
+from datetime import date
+
+import pytest
+
+from model import Image, Listing, User, db
+
+
+@pytest.fixture
+def setUp(client):
+    seller = User(email="seller@example.com", first_name="Sam",
+                  last_name="Seller", school="UVM", hashed_password="x")
+    db.session.add(seller)
+    db.session.commit()
+    for i in range(5):
+        listing = Listing(seller_id=seller.id, name=f"Item {i}",
+                          description=f"Description {i}", price=10.0 + i,
+                          post_date=date(2025, 1, i + 1))
+        db.session.add(listing)
+    db.session.commit()
+    db.session.add(Image(listing_id=1, name="a.jpg", encoded=b"aGVsbG8="))
+    db.session.commit()
+    return client
+
+
+def test_default_fields(setUp):
+    response = setUp.get("/api/listings")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data["listings"]) == 5
+    assert data["next_cursor"] is None
+    first = data["listings"][0]
+    assert first["name"] == "Item 0"
+    assert first["post_date"] == "2025-01-01"
+    assert "description" not in first
+    assert "images" not in first
+
+
+def test_field_selection(setUp):
+    response = setUp.get("/api/listings?fields=id,description,images")
+    first = response.get_json()["listings"][0]
+    assert set(first) == {"id", "description", "images"}
+    assert first["images"] == [{"name": "a.jpg", "encoded": "aGVsbG8="}]
+
+    response = setUp.get("/api/listings?fields=id,password")
+    assert response.status_code == 400
+
+
+def test_cursor_pagination(setUp):
+    data = setUp.get("/api/listings?limit=2").get_json()
+    assert [l["id"] for l in data["listings"]] == [1, 2]
+    assert data["next_cursor"] == 2
+
+    data = setUp.get(f"/api/listings?limit=2&cursor={data['next_cursor']}").get_json()
+    assert [l["id"] for l in data["listings"]] == [3, 4]
+
+    data = setUp.get(f"/api/listings?limit=2&cursor={data['next_cursor']}").get_json()
+    assert [l["id"] for l in data["listings"]] == [5]
+    assert data["next_cursor"] is None
+
+
+def test_filters(setUp):
+    data = setUp.get("/api/listings?min-price=12&search=Item").get_json()
+    assert [l["name"] for l in data["listings"]] == ["Item 2", "Item 3", "Item 4"]
+
+
+def test_ndjson_export(setUp):
+    response = setUp.get("/api/listings?format=ndjson&fields=id,name")
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert len(rows) == 5
+    assert rows[0] == {"id": 1, "name": "Item 0"}
+
+
+def test_invalid_cursor(setUp):
+    response = setUp.get("/api/listings?cursor=abc")
+    assert response.status_code == 400
+    assert response.get_json()["message"] == "Invalid cursor"
+
+
+def test_export_does_not_block_writers(tmp_path, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "EXPORT_BATCH_SIZE", 2)
+    path = tmp_path / "app.db"
+    app = app_module.create_app({"TESTING": True,
+                                 "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email="seller@example.com", first_name="Sam",
+                            last_name="Seller", hashed_password="x"))
+        db.session.add_all(Listing(seller_id=1, name=f"Item {i}",
+                                   description="", price=10.0 + i,
+                                   post_date=date(2025, 1, 1))
+                           for i in range(5))
+        db.session.commit()
+
+        response = app.test_client().get(
+            "/api/listings?format=ndjson&fields=id", buffered=False)
+        chunks = iter(response.response)
+        lines = next(chunks).decode().splitlines()
+        # A writer that does not wait gets the lock mid export
+        conn = sqlite3.connect(path, timeout=0)
+        conn.execute("UPDATE listing SET price = 1 WHERE id = 5")
+        conn.commit()
+        conn.close()
+        for chunk in chunks:
+            lines += chunk.decode().splitlines()
+        response.close()
+    assert [json.loads(line)["id"] for line in lines] == [1, 2, 3, 4, 5]
@@ -0,0 +1,88 @@
+import pytest
+
+from model import User, db
+
+
+@pytest.fixture
+def profiler(app):
+    return app.extensions["profiler"]
+
+
+@pytest.fixture
+def setUp(app, client, profiler):
+    for email in ("admin@example.com", "user@example.com"):
+        user = User(email=email, first_name="A", last_name="B")
+        user.password = "password123"
+        db.session.add(user)
+    db.session.commit()
+    app.config["ADMIN_EMAILS"] = ["admin@example.com"]
+    app.config["PROFILER_INTERVAL"] = 0.001
+    yield client
+    profiler.stop()
+
+
+def test_requires_admin(setUp, login):
+    assert setUp.post("/admin/profiler/start").status_code == 403
+    login(setUp, "user@example.com")
+    assert setUp.post("/admin/profiler/start").status_code == 403
+    assert setUp.get("/admin/profiler/top").status_code == 403
+
+
+def test_disabled_by_default(setUp, profiler, login):
+    login(setUp, "user@example.com")
+    assert not profiler.active
+    assert profiler.threads == {}
+    assert profiler.collapsed() == ""
+
+
+def test_profile_requests(app, setUp, profiler, login):
+    login(setUp, "admin@example.com")
+    response = setUp.post("/admin/profiler/start", data={"rate": "1"})
+    assert response.get_json()["active"]
+
+    # Password hashing keeps the login route busy long enough to sample.
+    # Separate app context so the logged in user is not cached in g.
+    with app.app_context():
+        login(app.test_client(), "user@example.com")
+    setUp.post("/admin/profiler/stop")
+    assert profiler.threads == {}
+
+    collapsed = setUp.get("/admin/profiler/collapsed?endpoint=main.login")
+    lines = collapsed.get_data(as_text=True).splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert stack.startswith("main.login;")
+        assert int(count) > 0
+    assert any("app.py:login" in line for line in lines)
+
+    top = setUp.get("/admin/profiler/top?n=5").get_json()
+    assert top["main.login"]["samples"] > 0
+    assert len(top["main.login"]["functions"]) == 5
+
+
+def test_time_window(setUp, profiler, login):
+    login(setUp, "admin@example.com")
+    setUp.post("/admin/profiler/start", data={"duration": "0.01"})
+    profiler.sampler.join(timeout=1)
+    assert not profiler.active
+
+
+def test_duration_capped(app, setUp, profiler, login):
+    app.config["PROFILER_MAX_DURATION"] = 0.01
+    login(setUp, "admin@example.com")
+    response = setUp.post("/admin/profiler/start")
+    assert response.get_json()["duration"] == 0.01
+    assert setUp.post("/admin/profiler/start", data={"duration": "60"}) \
+        .get_json()["duration"] == 0.01
+    profiler.sampler.join(timeout=1)
+    assert not profiler.active
+
+
+def test_invalid_rate(setUp, login):
+    login(setUp, "admin@example.com")
+    for data in ({"rate": "2"}, {"rate": "nan"},
+                 {"duration": "nan"}, {"duration": "inf"},
+                 {"duration": "-1"}):
+        assert setUp.post("/admin/profiler/start",
+                          data=data).status_code == 400
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from model import User, db
+from ratelimit import MemoryBackend, SQLiteBackend
+
+
+@pytest.fixture
+def setUp(app, client):
+    user = User(email="user@example.com", first_name="A", last_name="B")
+    user.password = "password123"
+    db.session.add(user)
+    db.session.commit()
+    return client
+
+
+def test_login_limited_per_email(setUp, login):
+    for _ in range(5):
+        assert login(setUp, "user@example.com", "wrong").status_code == 200
+    response = login(setUp, "USER@example.com", "wrong")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert login(setUp, "other@example.com", "wrong").status_code == 200
+    # Someone else's failed attempts do not lock the account out
+    response = setUp.post("/login", data={"email": "user@example.com",
+                                          "password": "wrong"},
+                          environ_base={"REMOTE_ADDR": "10.0.0.2"})
+    assert response.status_code == 200
+    # Only submissions are limited
+    assert setUp.get("/login").status_code == 200
+
+
+def test_search_limited_per_ip(app, setUp):
+    app.config["RATELIMIT_RULES"] = {
+        "main.listings": {"args": ["search"], "limits": [("ip", 2, 60)]}}
+    assert setUp.get("/?search=desk").status_code == 200
+    assert setUp.get("/?search=lamp").status_code == 200
+    assert setUp.get("/?search=desk").status_code == 429
+    assert setUp.get("/").status_code == 200
+
+
+def test_concurrency_limit(app, setUp, login):
+    limiter = app.extensions["ratelimit"]
+    slot = threading.BoundedSemaphore(1)
+    limiter.semaphores["main.login"] = slot
+    slot.acquire()
+    response = login(setUp, "user@example.com", "wrong")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    slot.release()
+    assert login(setUp, "user@example.com", "wrong").status_code == 200
+    assert limiter.in_flight["main.login"] == 0
+    # The slot was given back
+    assert slot.acquire(blocking=False)
+
+
+def test_rejection_metrics(app, setUp, login):
+    app.config["RATELIMIT_RULES"] = {
+        "main.login": {"limits": [("ip", 1, 60)]}}
+    login(setUp, "user@example.com", "wrong")
+    login(setUp, "user@example.com", "wrong")
+    body = setUp.get("/metrics").get_data(as_text=True)
+    assert 'ratelimit_rejections_total{endpoint="main.login",reason="rate"} 1' \
+        in body
+
+
+def test_disabled(app, setUp, login):
+    app.config["RATELIMIT_ENABLED"] = False
+    for _ in range(10):
+        assert login(setUp, "user@example.com", "wrong").status_code == 200
+
+
+def test_memory_backend_refills():
+    backend = MemoryBackend()
+    assert backend.take("k", 2, 100) == 0
+    assert backend.take("k", 2, 100) == 0
+    retry_after = backend.take("k", 2, 100)
+    assert 0 < retry_after <= 0.01
+    time.sleep(0.02)
+    assert backend.take("k", 2, 100) == 0
+
+
+def test_sqlite_backend_shared(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    assert first.take("k", 2, 0.1) == 0
+    assert second.take("k", 2, 0.1) == 0
+    assert first.take("k", 2, 0.1) > 0
+    assert second.take("other", 2, 0.1) == 0
+
+
+def test_shared_storage(app, setUp, tmp_path, login):
+    app.config["RATELIMIT_STORAGE"] = str(tmp_path / "ratelimit.db")
+    for _ in range(5):
+        login(setUp, "user@example.com", "wrong")
+    assert login(setUp, "user@example.com", "wrong").status_code == 429
+    assert isinstance(app.extensions["ratelimit"].backend, SQLiteBackend)
+
+
+def test_trusted_proxy():
+    from app import create_app
+
+    app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite://",
+                      "TRUSTED_PROXIES": 1})
+    app.config["RATELIMIT_RULES"] = {
+        "main.listings": {"args": ["search"], "limits": [("ip", 1, 60)]}}
+    client = app.test_client()
+
+    def search(address):
+        return client.get("/?search=desk",
+                          headers={"X-Forwarded-For": address},
+                          environ_base={"REMOTE_ADDR": "127.0.0.1"})
+
+    with app.app_context():
+        db.create_all()
+        assert search("10.0.0.1").status_code == 200
+        # Another client behind the same proxy has its own bucket
+        assert search("10.0.0.2").status_code == 200
+        assert search("10.0.0.1").status_code == 429
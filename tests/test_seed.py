@@ -0,0 +1,28 @@
+from model import Image, Listing, User, db
+from seed import seed_database
+
+
+def test_seed_counts(client):
+    counts = seed_database(20, 100, 30, seed=1)
+    assert counts == {"users": 20, "listings": 100, "images": 30}
+    assert User.query.count() == 20
+    assert Listing.query.count() == 100
+    assert Image.query.count() == 30
+    assert User.authenticate("user1@example.com", "password123")
+
+
+def test_seed_is_deterministic(client):
+    seed_database(10, 50, 0, seed=7)
+    first = [(l.name, l.price, l.seller_id) for l in Listing.query.order_by(Listing.id)]
+    db.drop_all()
+    db.create_all()
+    seed_database(10, 50, 0, seed=7)
+    second = [(l.name, l.price, l.seller_id) for l in Listing.query.order_by(Listing.id)]
+    assert first == second
+
+
+def test_seed_appends(client):
+    seed_database(5, 10, 0)
+    seed_database(5, 10, 0)
+    assert User.query.count() == 10
+    assert Listing.query.count() == 20
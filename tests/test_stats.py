@@ -0,0 +1,168 @@
+import hashlib
+import hmac
+import json
+import time
+from datetime import date
+
+import pytest
+import stripe
+from sqlalchemy import select
+
+import stripe_handler
+
+from model import Image, Listing, ListingStats, SellerDailyStats, User, db
+from stats import rebuild_stats, record_order, record_view, seller_dashboard
+
+
+@pytest.fixture
+def setUp(client):
+    for email in ("seller@example.com", "buyer@example.com"):
+        user = User(email=email, first_name="A", last_name="B")
+        user.password = "password123"
+        db.session.add(user)
+    db.session.commit()
+    for i in range(2):
+        db.session.add(Listing(seller_id=1, name=f"Item {i}", description="",
+                               price=10.0 * (i + 1),
+                               post_date=date(2025, 1, 1)))
+    db.session.commit()
+    db.session.add(Image(listing_id=1, name="a.jpg", encoded=b"aGVsbG8="))
+    db.session.commit()
+    return client
+
+
+def snapshot():
+    return {
+        "listings": sorted((s.listing_id, s.seller_id, s.views, s.sales,
+                            s.revenue)
+                           for s in db.session.scalars(select(ListingStats))),
+        "days": sorted((s.seller_id, s.day, s.views, s.sales, s.revenue)
+                       for s in db.session.scalars(select(SellerDailyStats))),
+    }
+
+
+def test_incremental_totals(setUp):
+    first, second = db.session.scalars(select(Listing)).all()
+    for _ in range(3):
+        record_view(first, 2)
+    record_view(second, 2)
+    record_order(first, 2)
+    record_order(first, 2, amount=8.0, checkout_session="cs_1")
+
+    assert snapshot() == {
+        "listings": [(1, 1, 3, 2, 18.0), (2, 1, 1, 0, 0.0)],
+        "days": [(1, date.today(), 4, 2, 18.0)],
+    }
+    dashboard = seller_dashboard(1)
+    assert dashboard["listings"][0]["conversion"] == 66.7
+    assert dashboard["totals"] == {"views": 4, "sales": 2, "revenue": 18.0,
+                                   "conversion": 50.0}
+
+
+def test_checkout_session_recorded_once(setUp):
+    listing = db.session.get(Listing, 1)
+    assert record_order(listing, 2, checkout_session="cs_1") is not None
+    assert record_order(listing, 2, checkout_session="cs_1") is None
+    assert db.session.get(ListingStats, 1).sales == 1
+
+
+def checkout_data(client_reference_id):
+    return {"id": "cs_1", "object": "checkout.session", "status": "complete",
+            "payment_status": "paid", "amount_total": 1000,
+            "metadata": {"listing_id": "1"},
+            "client_reference_id": client_reference_id}
+
+
+def checkout(client_reference_id):
+    return stripe.checkout.Session.construct_from(
+        checkout_data(client_reference_id), "sk_test_123")
+
+
+def test_payment_success_checks_buyer(setUp, monkeypatch, login):
+    monkeypatch.setenv("STRIPE_SECRET_KEY", "sk_test_123")
+    sessions = {"cs_other": checkout("3"), "cs_1": checkout("2")}
+    monkeypatch.setattr(
+        stripe_handler.StripeHandler, "check_checkout_session",
+        lambda self, session_id: (sessions[session_id], "complete"))
+    login(setUp, "buyer@example.com")
+
+    # Someone else's session id
+    setUp.get("/payment_success?session_id=cs_other")
+    assert db.session.get(ListingStats, 1) is None
+
+    setUp.get("/payment_success?session_id=cs_1")
+    stats = db.session.get(ListingStats, 1)
+    assert (stats.sales, stats.revenue) == (1, 10.0)
+
+
+def webhook(client, secret, event):
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(),
+                         hashlib.sha256).hexdigest()
+    return client.post("/stripe/webhook", data=payload, headers={
+        "Content-Type": "application/json",
+        "Stripe-Signature": f"t={timestamp},v1={signature}"})
+
+
+def test_webhook_records_order(app, setUp):
+    event = {"id": "evt_1", "object": "event",
+             "type": "checkout.session.completed",
+             "data": {"object": checkout_data("2")}}
+    assert webhook(setUp, "whsec_1", event).status_code == 404
+
+    app.config["STRIPE_WEBHOOK_SECRET"] = "whsec_1"
+    assert webhook(setUp, "whsec_other", event).status_code == 400
+    assert db.session.get(ListingStats, 1) is None
+
+    assert webhook(setUp, "whsec_1", event).status_code == 200
+    # Stripe retries deliveries
+    assert webhook(setUp, "whsec_1", event).status_code == 200
+    stats = db.session.get(ListingStats, 1)
+    assert (stats.sales, stats.revenue) == (1, 10.0)
+
+
+def test_rebuild_matches_incremental(setUp):
+    first, second = db.session.scalars(select(Listing)).all()
+    record_view(first, 2)
+    record_view(second, 2)
+    record_order(second, 2)
+    expected = snapshot()
+
+    db.session.query(ListingStats).delete()
+    db.session.commit()
+    assert rebuild_stats() == {"listings": 2, "days": 1}
+    assert snapshot() == expected
+
+
+def test_own_views_not_recorded(setUp, login):
+    login(setUp, "seller@example.com")
+    setUp.get("/listing-detail?id=1")
+    assert db.session.get(ListingStats, 1) is None
+
+
+def test_dashboard(app, setUp, max_queries, login):
+    with app.app_context():
+        buyer = app.test_client()
+        login(buyer, "buyer@example.com")
+        buyer.get("/listing-detail?id=1")
+        buyer.get("/listing-detail?id=1")
+    record_order(db.session.get(Listing, 1), 2)
+
+    login(setUp, "seller@example.com")
+    # User, listings with their totals, daily totals
+    with max_queries(3):
+        response = setUp.get("/dashboard")
+    body = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert ">Item 0</a>" in body
+    assert "<td>2</td>" in body
+    assert "50.0%" in body
+
+
+def test_my_listings(setUp, max_queries, login):
+    login(setUp, "seller@example.com")
+    with max_queries(3):
+        body = setUp.get("/my-listings").get_data(as_text=True)
+    assert "Item 0" in body and "Item 1" in body
+    assert "data:image/;base64,aGVsbG8=" in body
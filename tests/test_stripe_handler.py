@@ -1,10 +1,12 @@
 import pytest
 from src.stripe_handler import StripeHandler
-from src.app import app
+from src.app import create_app
 import stripe
 from unittest.mock import patch, MagicMock
 from dotenv import load_dotenv
 
+app = create_app()
+
 @pytest.fixture
 def setUp():
     load_dotenv()